@@ -1,4 +1,7 @@
 import asyncio
+import hashlib
+import importlib
+import json
 import logging
 import logging.handlers
 import signal
@@ -7,8 +10,14 @@ import zoneinfo
 import discord
 from discord.ext import commands
 
+import metrics
 import settings
+from database.command_tree import get_command_tree_hash
+from database.command_tree import set_command_tree_hash
 from database.setup import connect_to_db
+from database.setup import disconnect_from_db
+from database.setup import get_async_session
+from log_queue import attach_queue_handler
 
 discord.VoiceClient.warn_nacl = False  # annoying pop-up warning
 default_timezone = zoneinfo.ZoneInfo("America/New_York")
@@ -25,12 +34,14 @@ class KeyboardInterruptHandler:
 
 
 class CustomBot(commands.Bot):
-    def __init__(
+    def __init__(  # noqa: PLR0913
         self,
         *args,
         initial_extensions: list[str] | None = None,
         extension_settings: dict | None = None,
         testing_guild_id: int | None = None,
+        sync_commands: bool = True,
+        metrics_port: int | None = None,
         timezone=default_timezone,
         version="N/A",
         **kwargs,
@@ -45,58 +56,133 @@ class CustomBot(commands.Bot):
         self.extension_settings = extension_settings
 
         self.testing_guild_id = testing_guild_id
+        self.sync_commands = sync_commands
+        self.metrics_server = metrics.MetricsServer(settings.METRICS_HOST, metrics_port) if metrics_port else None
         self.timezone = timezone
         self.version = version
 
     async def setup_hook(self) -> None:
+        metrics.gauge("bot_gateway_latency_seconds", "Gateway heartbeat latency.").set_function(lambda: self.latency)
+        metrics.gauge("bot_guilds", "Guilds the bot is in.").set_function(lambda: len(self.guilds))
+        if self.metrics_server:
+            await self.metrics_server.start()
+
+        # connect to database first so extensions can read their state as they load,
+        # extensions create their own tables through `ensure_tables`
+        await connect_to_db()
+
         # setup extensions & sync commands for test guild
         for extension in self.initial_extensions:
             await self.load_extension(extension)
         await self.refresh_testing_guild()
 
-        # connect to database after loading extensions
-        await connect_to_db()
+    async def close(self) -> None:
+        # extensions are unloaded (and flush their state) before the database goes away
+        await super().close()
+        await disconnect_from_db()
+        if self.metrics_server:
+            await self.metrics_server.close()
+
+    async def refresh_testing_guild(self, *, force: bool = False) -> bool:
+        """Sync the command tree to the testing guild if it changed since the last sync, returns whether it synced."""
+        if not (self.testing_guild_id and self.sync_commands):
+            return False
+
+        guild = discord.Object(self.testing_guild_id)
+        self.tree.copy_global_to(guild=guild)
+
+        # syncing is heavily rate limited, skip it when Discord already has this exact tree
+        scope = f"{self.application_id}:{guild.id}"
+        tree_hash = command_tree_hash(self.tree, guild)
+        async with get_async_session() as session:
+            if not force and await get_command_tree_hash(session, scope) == tree_hash:
+                logging.getLogger("discord").info("Command tree for guild %d is unchanged, skipping sync", guild.id)
+                return False
 
-    async def refresh_testing_guild(self):
-        if self.testing_guild_id:
-            guild = discord.Object(self.testing_guild_id)
-            self.tree.copy_global_to(guild=guild)
             await self.tree.sync(guild=guild)
+            await set_command_tree_hash(session, scope, tree_hash)
+        logging.getLogger("discord").info("Synced command tree for guild %d", guild.id)
+        return True
+
+
+class ShardedCustomBot(CustomBot, commands.AutoShardedBot):
+    """`CustomBot` that runs several shards in one process, either all of them or the `shard_ids` it's given."""
+
+
+def command_tree_hash(tree: discord.app_commands.CommandTree, guild: discord.abc.Snowflake | None = None) -> str:
+    """Stable hash of the commands Discord would receive for `guild`, independent of registration order."""
+    payload = sorted(
+        (command.to_dict(tree) for command in tree.get_commands(guild=guild)),
+        key=lambda command: (command["type"], command["name"]),
+    )
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
 
 
 def setup_bot_logging():
     logger = logging.getLogger("discord")
     logger.setLevel(logging.INFO)
 
-    # clear previous handlers
-    for handler in logger.handlers:
-        logger.removeHandler(handler)
+    # replaces any previous handlers
+    return attach_queue_handler(logger, settings.LOG_FORMAT)
+
+
+def resolve_intents(profile: dict, extensions: list[str]) -> discord.Intents:
+    """Gateway intents for a runtime profile, "extensions" profiles only enable what the loaded extensions use.
+
+    Each extension package declares the intents its own listeners and commands need as `INTENTS`, e.g. prefix
+    commands need guild/DM messages and their content, app commands need none.
+    """
+    if profile["intents"] == "all":
+        return discord.Intents.all()
 
-    handler = logging.StreamHandler()
-    dt_fmt = "%Y-%m-%d %H:%M:%S"
-    formatter = logging.Formatter("[{asctime}] [{levelname}] {name}: {message}", dt_fmt, style="{")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
-    return logger
+    # combine the intents each extension declares, extensions that don't declare any get the defaults
+    intents = discord.Intents.none()
+    for extension in extensions:
+        intents |= getattr(importlib.import_module(extension), "INTENTS", discord.Intents.default())
+    return intents
+
+
+def resolve_member_cache_flags(profile: dict, intents: discord.Intents) -> discord.MemberCacheFlags:
+    if profile["member_cache"] == "all":
+        return discord.MemberCacheFlags.all()
+    if profile["member_cache"] == "none":
+        return discord.MemberCacheFlags.none()
+    return discord.MemberCacheFlags.from_intents(intents)
 
 
 async def main():
+    token = settings.require_bot_token()
     setup_bot_logging()
 
-    intents = discord.Intents.all()
+    profile = settings.RUNTIME_PROFILES[settings.RUNTIME_PROFILE]
+    intents = resolve_intents(profile, settings.ENABLED_EXTENSIONS)
+    logging.getLogger("discord").info("Using runtime profile %s with %r", settings.RUNTIME_PROFILE, intents)
+
+    bot_cls = CustomBot
+    sharding_options = {}
+    if settings.SHARDING:
+        bot_cls = ShardedCustomBot
+        sharding_options = {"shard_count": settings.SHARD_COUNT, "shard_ids": settings.SHARD_IDS}
+        logging.getLogger("discord").info("Running shards %s of %s", settings.SHARD_IDS or "all", settings.SHARD_COUNT)
 
-    async with CustomBot(
+    async with bot_cls(
         command_prefix=commands.when_mentioned_or(*settings.BOT_PREFIXES),
         intents=intents,
+        member_cache_flags=resolve_member_cache_flags(profile, intents),
+        chunk_guilds_at_startup=profile["chunk_guilds_at_startup"],
+        max_messages=profile["max_messages"],
         initial_extensions=settings.ENABLED_EXTENSIONS,
         extension_settings=settings.EXTENSION_SETTINGS,
         testing_guild_id=settings.TESTING_GUILD_ID,
+        sync_commands=settings.SHARD_PRIMARY,
+        metrics_port=settings.METRICS_PORT,
         owner_id=settings.DISCORD_OWNER_ID,
         timezone=settings.TIMEZONE,
         version=settings.VERSION,
+        **sharding_options,
     ) as bot:
         bot.loop.add_signal_handler(signal.SIGINT, KeyboardInterruptHandler(bot))
-        await bot.start(settings.BOT_TOKEN)
+        await bot.start(token)
 
 
 if __name__ == "__main__":
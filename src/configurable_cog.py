@@ -4,6 +4,46 @@ from types import SimpleNamespace
 
 from discord.ext import commands
 
+import metrics
+
+COMMANDS_TOTAL = metrics.counter("bot_commands_total", "Commands invoked, per cog.", ("cog", "command"))
+COMMAND_ERRORS_TOTAL = metrics.counter(
+    "bot_command_errors_total",
+    "Commands that raised, per cog.",
+    ("cog", "command"),
+)
+
+
+def _app_command_name(interaction) -> str:
+    return interaction.command.qualified_name if interaction.command else "unknown"
+
+
+def load_settings(cog_id: str, default_settings: dict, extension_settings: dict) -> SimpleNamespace:
+    """Merge `extension_settings[cog_id]` over `default_settings`, also used by processes that run without a bot."""
+    # use default settings
+    if cog_id not in extension_settings:
+        return SimpleNamespace(**default_settings)
+
+    provided_settings = extension_settings[cog_id]
+    _merged = provided_settings.copy()
+
+    # copy over any missing keys from the default settings
+    for k, v in default_settings.items():
+        if k not in _merged:
+            _merged[k] = v
+
+    # verify types
+    for mk in _merged:
+        # if its a default setting key and an incorrect value, bitch about it
+        if mk in default_settings and not isinstance(_merged[mk], type(default_settings[mk])):
+            msg = (
+                f"Invalid types {mk}: {_merged[mk]} passed for"
+                f" {cog_id}, was expecting {type(default_settings[mk])}"
+            )
+            raise TypeError(msg)
+
+    return SimpleNamespace(**_merged)
+
 
 class ConfigurableCog(commands.Cog):
     """A cog that can be configured with settings from the bot's settings, includes a logger with `self.logger`."""
@@ -20,32 +60,27 @@ class ConfigurableCog(commands.Cog):
         self.start_time = datetime.now(self.bot.timezone)
         self.settings = self._load_settings()
 
+    async def cog_before_invoke(self, ctx: commands.Context):
+        COMMANDS_TOTAL.inc(cog=self.cog_id, command=ctx.command.qualified_name)
+
+    async def cog_after_invoke(self, ctx: commands.Context):
+        # after-invoke hooks run even when the command raised, unlike overriding `cog_command_error`
+        # this keeps the bot's default error reporting for the cog
+        if ctx.command_failed:
+            COMMAND_ERRORS_TOTAL.inc(cog=self.cog_id, command=ctx.command.qualified_name)
+
+    async def interaction_check(self, interaction) -> bool:
+        # runs before every app command in the cog, so it doubles as the app command counter
+        COMMANDS_TOTAL.inc(cog=self.cog_id, command=_app_command_name(interaction))
+        return True
+
+    async def cog_app_command_error(self, interaction, error: Exception):
+        COMMAND_ERRORS_TOTAL.inc(cog=self.cog_id, command=_app_command_name(interaction))
+
     def _setup_logger(self, logger_level):
         logger = logging.getLogger("bloom." + self.cog_id)
         logger.setLevel(logger_level)
         return logger
 
     def _load_settings(self):
-        # use default settings
-        if self.cog_id not in self.bot.extension_settings:
-            return SimpleNamespace(**self._default_settings)
-
-        provided_settings = self.bot.extension_settings[self.cog_id]
-        _merged = provided_settings.copy()
-
-        # copy over any missing keys from the default settings
-        for k in self._default_settings:
-            if k not in _merged:
-                _merged[k] = self._default_settings[k]
-
-        # verify types
-        for mk in _merged:
-            # if its a default setting key and an incorrect value, bitch about it
-            if mk in self._default_settings and not isinstance(_merged[mk], type(self._default_settings[mk])):
-                msg = (
-                    f"Invalid types {mk}: {_merged[mk]} passed for"
-                    f" {self.cog_id}, was expecting {type(self._default_settings[k])}"
-                )
-                raise TypeError(msg)
-
-        return SimpleNamespace(**_merged)
+        return load_settings(self.cog_id, self._default_settings, self.bot.extension_settings)
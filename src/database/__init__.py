@@ -1,4 +1,7 @@
-from .setup import connect_to_db, get_async_session
+from .setup import connect_to_db
+from .setup import disconnect_from_db
+from .setup import ensure_tables
+from .setup import get_async_session
 from .tables import Base
 
-__all__ = ["connect_to_db", "get_async_session", "Base"]
+__all__ = ["Base", "connect_to_db", "disconnect_from_db", "ensure_tables", "get_async_session"]
@@ -0,0 +1,31 @@
+import time
+
+from sqlalchemy import Column
+from sqlalchemy import Float
+from sqlalchemy import String
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .tables import Base
+
+
+class CommandTreeHash(Base):
+    __tablename__ = "command_tree_hash"
+    scope = Column(String, primary_key=True)  # "{application_id}:{guild_id or 'global'}"
+    hash = Column(String, nullable=False)
+    synced_at = Column(Float, nullable=False)  # unix timestamp
+
+
+async def get_command_tree_hash(session: AsyncSession, scope: str) -> str | None:
+    """Get the hash of the command tree last synced for `scope`."""
+    result = await session.execute(select(CommandTreeHash.hash).where(CommandTreeHash.scope == scope))
+    return result.scalar_one_or_none()
+
+
+async def set_command_tree_hash(session: AsyncSession, scope: str, tree_hash: str) -> None:
+    values = {"hash": tree_hash, "synced_at": time.time()}
+    stmt = sqlite_insert(CommandTreeHash).values(scope=scope, **values)
+    stmt = stmt.on_conflict_do_update(index_elements=["scope"], set_=values)
+    await session.execute(stmt)
+    await session.commit()
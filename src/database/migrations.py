@@ -0,0 +1,67 @@
+"""In-place schema upgrades for existing databases.
+
+`create_all` only creates missing tables, so changes to existing tables are applied here. The schema version is
+kept in SQLite's `user_version` pragma and each migration runs once, in order. Migrations must tolerate their
+tables not existing yet, fresh tables are created by `create_all` with the current schema.
+"""
+
+import logging
+
+from sqlalchemy import Connection
+from sqlalchemy import inspect
+
+logger = logging.getLogger("discord-aggregator")
+
+
+def _unique_source_key_overrides(conn: Connection):
+    if not inspect(conn).has_table("guild_user_source_key_override"):
+        return
+
+    # keep the most recent override for each (guild, user) so the unique index can be built
+    conn.exec_driver_sql(
+        "DELETE FROM guild_user_source_key_override WHERE id NOT IN "
+        "(SELECT MAX(id) FROM guild_user_source_key_override GROUP BY guild_id, user_id)",
+    )
+    conn.exec_driver_sql(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_guild_user_source_key_override_guild_user "
+        "ON guild_user_source_key_override (guild_id, user_id)",
+    )
+
+
+def _publish_outbox_guild_id(conn: Connection):
+    if not inspect(conn).has_table("publish_outbox"):
+        return
+    if "guild_id" in {column["name"] for column in inspect(conn).get_columns("publish_outbox")}:
+        return
+
+    # entries stored before the column existed are claimed as one guild of their own
+    conn.exec_driver_sql("ALTER TABLE publish_outbox ADD COLUMN guild_id BIGINT")
+
+
+def _publish_outbox_turns(conn: Connection):
+    if not inspect(conn).has_table("publish_outbox"):
+        return
+    if "turn" not in {column["name"] for column in inspect(conn).get_columns("publish_outbox")}:
+        # entries stored before the column existed have no turn and are claimed first
+        conn.exec_driver_sql("ALTER TABLE publish_outbox ADD COLUMN turn FLOAT")
+
+    conn.exec_driver_sql("DROP INDEX IF EXISTS ix_publish_outbox_status_next_attempt_at")
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_publish_outbox_status_turn ON publish_outbox (status, turn)")
+    conn.exec_driver_sql(
+        "CREATE INDEX IF NOT EXISTS ix_publish_outbox_guild_turn ON publish_outbox (guild_id, turn)",
+    )
+
+
+MIGRATIONS = [
+    _unique_source_key_overrides,
+    _publish_outbox_guild_id,
+    _publish_outbox_turns,
+]
+
+
+def run_migrations(conn: Connection, *args):
+    version = conn.exec_driver_sql("PRAGMA user_version").scalar()
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        logger.info("Applying database migration %d: %s", number, migration.__name__.strip("_"))
+        migration(conn)
+        conn.exec_driver_sql(f"PRAGMA user_version = {number}")
@@ -1,22 +1,80 @@
+import logging
+
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine
 
+from log_queue import attach_queue_handler
+from settings import DATABASE_ECHO
+from settings import DATABASE_MAX_OVERFLOW
+from settings import DATABASE_POOL_SIZE
+from settings import DATABASE_POOL_TIMEOUT
+from settings import DATABASE_PRAGMAS
+from settings import DATABASE_STATEMENT_CACHE_SIZE
+from settings import DATABASE_TYPE
 from settings import DATABASE_URL
-from settings import DEV
+from settings import LOG_FORMAT
 
+from .migrations import run_migrations
 from .tables import create_tables
 
 AsyncSessionLocal = async_sessionmaker(expire_on_commit=False)
+_engine = None
 
 
 def get_async_session():
     return AsyncSessionLocal()
 
 
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in DATABASE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    cursor.close()
+
+
+def _setup_echo_logging():
+    # `echo=True` would add a blocking stream handler, log the statements through the logging queue instead
+    logger = logging.getLogger("sqlalchemy.engine")
+    logger.setLevel(logging.INFO)
+    attach_queue_handler(logger, LOG_FORMAT)
+
+
+def create_engine():
+    if DATABASE_ECHO:
+        _setup_echo_logging()
+
+    if DATABASE_TYPE != "sqlite":
+        return create_async_engine(DATABASE_URL)
+
+    # aiosqlite runs each connection on its own thread, a small pool is plenty since SQLite has a single writer
+    engine = create_async_engine(
+        DATABASE_URL,
+        pool_size=DATABASE_POOL_SIZE,
+        max_overflow=DATABASE_MAX_OVERFLOW,
+        pool_timeout=DATABASE_POOL_TIMEOUT,
+        query_cache_size=DATABASE_STATEMENT_CACHE_SIZE,
+        connect_args={"cached_statements": DATABASE_STATEMENT_CACHE_SIZE},
+    )
+    event.listen(engine.sync_engine, "connect", _set_sqlite_pragmas)
+    return engine
+
+
 async def connect_to_db():
-    engine = create_async_engine(DATABASE_URL, echo=DEV)
+    global _engine  # noqa: PLW0603
+    _engine = create_engine()
+    await ensure_tables()
+
+    AsyncSessionLocal.configure(bind=_engine)
+
+
+async def disconnect_from_db():
+    if _engine:
+        await _engine.dispose()
 
-    async with engine.begin() as conn:
-        await conn.run_sync(create_tables, engine)
 
-    AsyncSessionLocal.configure(bind=engine)
+async def ensure_tables():
+    """Create any tables registered since connecting, e.g. by an extension that was just loaded."""
+    async with _engine.begin() as conn:
+        await conn.run_sync(create_tables, _engine)
+        await conn.run_sync(run_migrations)
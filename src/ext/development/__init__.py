@@ -1,5 +1,9 @@
+import discord
+
 from .extension import Development
 
+INTENTS = discord.Intents(guild_messages=True, dm_messages=True, message_content=True)
+
 
 async def setup(bot):
     await bot.add_cog(Development(bot))
@@ -13,13 +13,29 @@ class Development(ConfigurableCog):
     async def reload_extension(self, ctx: commands.Context, extension_id: str):
         """Owner only - Reload an extension."""
         try:
-            await self.bot.refresh_testing_guild()
             await self.bot.reload_extension("ext." + extension_id)
+            # only syncs when the reload changed the command tree
+            await self.bot.refresh_testing_guild()
             await ctx.send(f"Safely reloaded extension `ext.{extension_id}`.")
             self.logger.info("Reloaded extension %s", extension_id)
         except DiscordException as e:
             await ctx.send(f"There was an error while reloading extension `ext.{extension_id}`:", e)
 
+    @commands.command(name="sync-tree")
+    @commands.is_owner()
+    async def sync_tree(self, ctx: commands.Context):
+        """Owner only - Sync the command tree to the testing guild even if it hasn't changed."""
+        if not self.bot.testing_guild_id:
+            await ctx.send("No testing guild is configured.")
+            return
+        if not self.bot.sync_commands:
+            await ctx.send("Command syncing is disabled for this process.")
+            return
+
+        await self.bot.refresh_testing_guild(force=True)
+        await ctx.send(f"Synced the command tree to guild {self.bot.testing_guild_id}.")
+        self.logger.info("Force synced the command tree")
+
     @commands.command(name="shutdown")
     @commands.is_owner()
     async def shutdown(self, ctx: commands.Context):
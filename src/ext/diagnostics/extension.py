@@ -0,0 +1,111 @@
+import asyncio
+import io
+import threading
+import time
+from datetime import UTC
+from datetime import datetime
+
+import discord
+from discord.ext import commands
+
+from configurable_cog import ConfigurableCog
+
+from .monitor import LoopMonitor
+from .profiler import StackSampler
+
+default_settings = {
+    # loop lag monitor, `lag_window` samples are kept for percentiles (5 minutes at the default interval)
+    "lag_interval": 0.05,
+    "lag_window": 6000,
+    # the watchdog captures the loop thread's stack once the loop is blocked for `stall_threshold` seconds
+    "stall_threshold": 0.25,
+    "max_stalls": 50,
+    # sampling profiler
+    "profile_interval": 0.005,
+    "profile_max_duration": 120.0,
+}
+
+
+class Diagnostics(ConfigurableCog):
+    """Production-safe profiling and event loop monitoring, all commands are owner only."""
+
+    def __init__(self, bot, **kwargs):
+        super().__init__(bot, "diagnostics", default_settings, **kwargs)
+        self.monitor: LoopMonitor | None = None
+        self._profiling = asyncio.Lock()
+
+    async def cog_load(self):
+        super().cog_load()
+        self.monitor = LoopMonitor(
+            interval=self.settings.lag_interval,
+            window=self.settings.lag_window,
+            stall_threshold=self.settings.stall_threshold,
+            max_stalls=self.settings.max_stalls,
+        )
+        self.monitor.start()
+
+    async def cog_unload(self):
+        if self.monitor:
+            await self.monitor.close()
+
+    @commands.command(name="profile")
+    @commands.is_owner()
+    async def profile(self, ctx: commands.Context, seconds: float = 10.0, output: str = "text"):
+        """Owner only - Sample the event loop for some seconds, output is "text" (top functions) or "collapsed"."""
+        if output not in ("text", "collapsed"):
+            await ctx.send('Invalid output. Use "text" or "collapsed".')
+            return
+        if self._profiling.locked():
+            await ctx.send("A profile is already running.")
+            return
+
+        seconds = min(max(seconds, 1.0), self.settings.profile_max_duration)
+        async with self._profiling:
+            await ctx.send(f"Profiling for {seconds:g} seconds...")
+            sampler = StackSampler(threading.get_ident(), self.settings.profile_interval)
+            await asyncio.to_thread(sampler.run, seconds)
+
+        self.logger.info("Profiled the event loop for %gs, %d samples", seconds, sampler.samples)
+        if output == "collapsed":
+            body, filename = sampler.collapsed(), "profile.collapsed.txt"
+        else:
+            body, filename = sampler.report(), "profile.txt"
+        await ctx.send(
+            f"{sampler.samples} samples over {seconds:g} seconds.",
+            file=discord.File(io.BytesIO(body.encode()), filename=filename),
+        )
+
+    @commands.command(name="loop-lag")
+    @commands.is_owner()
+    async def loop_lag(self, ctx: commands.Context):
+        """Owner only - Show event loop lag percentiles from the background monitor."""
+        lags = self.monitor.lag_percentiles()
+        window = len(self.monitor.lags) * self.monitor.interval
+        await ctx.send(
+            f"Event loop lag over the last {window:.0f}s ({len(self.monitor.lags)} samples):\n"
+            + " ".join(f"{name} {value * 1000:.1f}ms" for name, value in lags.items())
+            + f"\nStalls over {self.monitor.stall_threshold * 1000:.0f}ms: {len(self.monitor.stalls)} recorded",
+        )
+
+    @commands.command(name="slow-callbacks")
+    @commands.is_owner()
+    async def slow_callbacks(self, ctx: commands.Context, count: int = 10):
+        """Owner only - Show the most recent event loop stalls and where the loop was blocked."""
+        stalls = list(self.monitor.stalls)[-max(1, count) :]
+        if not stalls:
+            await ctx.send("No stalls recorded.")
+            return
+
+        lines = []
+        stacks = []
+        now = time.time()
+        for stall in reversed(stalls):
+            started_at = datetime.fromtimestamp(stall.started_at, UTC).strftime("%H:%M:%S")
+            lines.append(
+                f"{started_at} ({now - stall.started_at:.0f}s ago) {stall.duration * 1000:.0f}ms in `{stall.culprit}`",
+            )
+            stacks.append(f"{started_at} {stall.duration * 1000:.0f}ms\n  " + "\n  ".join(stall.stack))
+        await ctx.send(
+            "\n".join(lines)[:2000],
+            file=discord.File(io.BytesIO("\n\n".join(stacks).encode()), filename="stalls.txt"),
+        )
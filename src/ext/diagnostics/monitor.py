@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import sys
+import sysconfig
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from dataclasses import field
+
+import metrics
+
+from .profiler import stack_labels
+
+logger = logging.getLogger("discord-aggregator")
+
+LOOP_LAG_SECONDS = metrics.histogram(
+    "bot_event_loop_lag_seconds",
+    "How late the event loop monitor woke up.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_STALLS_TOTAL = metrics.counter("bot_event_loop_stalls_total", "Times the event loop was blocked too long.")
+
+STDLIB = sysconfig.get_paths()["stdlib"]
+
+
+@dataclass
+class Stall:
+    """The event loop not running for longer than the stall threshold, with the blocking stack."""
+
+    started_at: float  # unix timestamp
+    duration: float  # seconds, updated while the stall lasts
+    stack: list[str] = field(default_factory=list)  # outermost first
+
+    @property
+    def culprit(self) -> str:
+        """Innermost frame outside the standard library, which is usually the blocking handler."""
+        for label in reversed(self.stack):
+            if STDLIB not in label:
+                return label
+        return self.stack[-1] if self.stack else "unknown"
+
+
+def percentile(samples: list[float], fraction: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LoopMonitor:
+    """Measures event loop lag with a ticking task, and catches stalls with a watchdog thread.
+
+    The task records how late each `interval` sleep wakes up. The watchdog checks the task's last tick and,
+    when the loop has been blocked for `stall_threshold` seconds, captures the loop thread's stack while it's
+    still blocked so the handler responsible can be reported.
+    """
+
+    def __init__(
+        self,
+        *,
+        interval: float = 0.05,
+        window: int = 6000,
+        stall_threshold: float = 0.25,
+        max_stalls: int = 50,
+    ):
+        self.interval = interval
+        self.stall_threshold = stall_threshold
+        self.lags: deque[float] = deque(maxlen=window)
+        self.stalls: deque[Stall] = deque(maxlen=max_stalls)
+
+        self.thread_id: int | None = None
+        self._last_tick = time.monotonic()
+        self._task: asyncio.Task | None = None
+        self._watchdog: threading.Thread | None = None
+        self._stopping = threading.Event()
+
+    def start(self):
+        self.thread_id = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stopping.clear()
+        self._task = asyncio.create_task(self._tick(), name="loop-monitor")
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def close(self):
+        self._stopping.set()
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog:
+            await asyncio.to_thread(self._watchdog.join)
+            self._watchdog = None
+
+    def lag_percentiles(self) -> dict[str, float]:
+        samples = list(self.lags)
+        return {
+            "p50": percentile(samples, 0.5),
+            "p90": percentile(samples, 0.9),
+            "p99": percentile(samples, 0.99),
+            "max": max(samples, default=0.0),
+        }
+
+    async def _tick(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._last_tick = time.monotonic()
+            lag = max(0.0, self._last_tick - start - self.interval)
+            self.lags.append(lag)
+            LOOP_LAG_SECONDS.observe(lag)
+
+    def _watch(self):
+        stall: Stall | None = None
+        stalled_tick = None
+        while not self._stopping.wait(self.interval):
+            last_tick = self._last_tick
+            blocked = time.monotonic() - last_tick - self.interval
+            if blocked < self.stall_threshold:
+                stall = None
+                continue
+
+            if stall is None or stalled_tick != last_tick:
+                frame = sys._current_frames().get(self.thread_id)  # noqa: SLF001
+                stall = Stall(time.time() - blocked, blocked, stack_labels(frame) if frame else [])
+                del frame
+                stalled_tick = last_tick
+                self.stalls.append(stall)
+                LOOP_STALLS_TOTAL.inc()
+                logger.warning("Event loop blocked for %.3fs in %s", blocked, stall.culprit)
+            else:
+                stall.duration = blocked
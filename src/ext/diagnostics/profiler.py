@@ -0,0 +1,75 @@
+import sys
+import threading
+import time
+from collections import Counter
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+def stack_labels(frame) -> list[str]:
+    """Labels of the frame and its callers, outermost first."""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class StackSampler:
+    """Sampling profiler for one thread, reads its stack from another thread every `interval` seconds.
+
+    Nothing is traced, so the sampled thread only pays for the GIL hand-offs and it is safe to run in production.
+    """
+
+    # innermost functions of a loop that is waiting for I/O
+    IDLE_FUNCTIONS = frozenset({"select", "poll", "epoll", "kqueue", "_run_once"})
+
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter[tuple[str, ...]] = Counter()
+        self.samples = 0
+        self.idle = 0
+
+    def run(self, duration: float):
+        """Sample for `duration` seconds, blocks the calling thread."""
+        deadline = time.monotonic() + duration
+        own_id = threading.get_ident()
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.thread_id)  # noqa: SLF001
+            if frame is not None and self.thread_id != own_id:
+                self.samples += 1
+                if frame.f_code.co_name in self.IDLE_FUNCTIONS:
+                    self.idle += 1
+                else:
+                    self.stacks[tuple(stack_labels(frame))] += 1
+            del frame
+            time.sleep(self.interval)
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope, one `a;b;c count` line per stack."""
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def report(self, limit: int = 25) -> str:
+        """Top functions by samples spent in the function itself and in the function or anything it called."""
+        own: Counter[str] = Counter()
+        total: Counter[str] = Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+
+        busy = self.samples - self.idle
+        lines = [
+            f"{self.samples} samples, {busy} busy ({busy / max(1, self.samples):.1%}), {self.idle} idle",
+            "",
+            f"Top {limit} functions by own time:",
+        ]
+        lines.extend(f"{count / max(1, busy):7.1%}  {label}" for label, count in own.most_common(limit))
+        lines.extend(["", f"Top {limit} functions by total time:"])
+        lines.extend(f"{count / max(1, busy):7.1%}  {label}" for label, count in total.most_common(limit))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,155 @@
+import asyncio
+import logging
+from collections.abc import Awaitable
+from collections.abc import Callable
+
+import discord
+
+from database import get_async_session
+
+from .data import get_backfill_checkpoint
+from .data import get_source_key
+from .data import save_backfill_checkpoint
+from .pipeline import PublishJob
+from .ratelimit import TokenBucket
+
+logger = logging.getLogger("discord-aggregator")
+
+
+class Backfill:
+    """Publishes a channel's history oldest first, checkpointing after every page so it can resume after a restart.
+
+    Submissions are bounded by `concurrency` and throttled to `rate` messages per second so live traffic
+    keeps most of the publish endpoint's capacity. Failed messages are retried `retries` times with exponential
+    backoff, if one still fails the backfill stops with status "failed" and its checkpoint stays before that
+    message, so starting it again resumes from there instead of skipping it.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        channel: discord.abc.Messageable,
+        submit: Callable[[list[PublishJob]], Awaitable[list[bool | None]]],
+        *,
+        make_job: Callable[[discord.Message, str | None], PublishJob] = PublishJob.from_message,
+        concurrency: int = 4,
+        rate: float = 5.0,
+        page_size: int = 100,
+        retries: int = 3,
+        retry_delay: float = 1.0,
+        report: Callable[["Backfill"], Awaitable[None]] | None = None,
+    ):
+        self.channel = channel
+        self.submit = submit
+        self.make_job = make_job
+        self.concurrency = concurrency
+        self.page_size = page_size
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.report = report
+
+        self.limiter = TokenBucket(rate, max(1, concurrency))
+        self.last_message_id: int | None = None
+        self.published = 0
+        self.failed = 0
+        self.skipped = 0
+        self.status = "running"
+
+    def describe(self) -> str:
+        return (
+            f"Backfill of {self.channel.mention} {self.status}: "
+            f"{self.published} published, {self.failed} failed, {self.skipped} skipped."
+        )
+
+    async def run(self, *, from_start: bool = False):
+        async with get_async_session() as session:
+            checkpoint = await get_backfill_checkpoint(session, self.channel.id)
+        if checkpoint and not from_start:
+            self.last_message_id = checkpoint.last_message_id
+            self.published = checkpoint.published
+            self.failed = checkpoint.failed
+        logger.info("Backfilling channel %d after message %s", self.channel.id, self.last_message_id)
+
+        completed = await self._publish_history()
+        self.status = "done" if completed else "failed"
+        await self._checkpoint()
+        if completed:
+            logger.info("Backfill of channel %d done, %d published", self.channel.id, self.published)
+        else:
+            logger.warning(
+                "Backfill of channel %d stopped after message %s, messages kept failing after %d retries",
+                self.channel.id,
+                self.last_message_id,
+                self.retries,
+            )
+
+    async def stop(self):
+        """Mark the backfill as stopped so it isn't resumed, call once its task has been cancelled."""
+        self.status = "stopped"
+        await self._checkpoint()
+
+    async def _publish_history(self) -> bool:
+        """Publish every page after the checkpoint, returns False if a page had messages that kept failing."""
+        after = discord.Object(self.last_message_id) if self.last_message_id else None
+        page: list[discord.Message] = []
+        async for message in self.channel.history(limit=None, after=after, oldest_first=True):
+            page.append(message)
+            if len(page) >= self.page_size:
+                if not await self._publish_page(page):
+                    return False
+                page = []
+        return not page or await self._publish_page(page)
+
+    async def _publish_page(self, page: list[discord.Message]) -> bool:
+        async with get_async_session() as session:
+            jobs = [
+                self.make_job(
+                    message,
+                    await get_source_key(session, guild_id=self.channel.guild.id, user_id=message.author.id),
+                )
+                for message in page
+            ]
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def submit(job: PublishJob) -> bool | None:
+            async with semaphore:
+                await self.limiter.acquire()
+                return (await self.submit([job]))[0]
+
+        results = await asyncio.gather(*(submit(job) for job in jobs))
+        for attempt in range(self.retries):
+            failed = [index for index, published in enumerate(results) if published is False]
+            if not failed:
+                break
+            await asyncio.sleep(self.retry_delay * 2**attempt)
+            retried = await asyncio.gather(*(submit(jobs[index]) for index in failed))
+            for index, published in zip(failed, retried, strict=True):
+                results[index] = published
+
+        self.published += results.count(True)
+        self.failed += results.count(False)
+        # None means the message was published recently and skipped
+        self.skipped += results.count(None)
+
+        # the checkpoint never moves past a failed message, messages after it are deduplicated when resent
+        first_failed = results.index(False) if False in results else None
+        if first_failed is None:
+            self.last_message_id = page[-1].id
+        elif first_failed:
+            self.last_message_id = page[first_failed - 1].id
+        await self._checkpoint()
+        if self.report:
+            await self.report(self)
+        return first_failed is None
+
+    async def _checkpoint(self):
+        async with get_async_session() as session:
+            await save_backfill_checkpoint(
+                session,
+                self.channel.id,
+                self.channel.guild.id,
+                last_message_id=self.last_message_id,
+                published=self.published,
+                failed=self.failed,
+                status=self.status,
+            )
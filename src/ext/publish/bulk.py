@@ -0,0 +1,161 @@
+"""Bulk import and export of publishing channels, guild source keys and user source key overrides.
+
+Files are CSV with a `type,guild_id,user_id,channel_id,source_key` header, or JSONL with the same fields.
+`type` is "channel" (guild_id, channel_id), "guild_key" (guild_id, source_key) or "user_key" (guild_id, user_id,
+source_key).
+"""
+
+import csv
+import io
+import json
+from collections.abc import Iterator
+from dataclasses import dataclass
+
+FORMATS = ("csv", "jsonl")
+FIELDS = ("type", "guild_id", "user_id", "channel_id", "source_key")
+# record type -> fields it requires besides `type` and `guild_id`
+RECORD_TYPES = {
+    "channel": ("channel_id",),
+    "guild_key": ("source_key",),
+    "user_key": ("user_id", "source_key"),
+}
+
+
+class BulkImportError(Exception):
+    """The file is invalid, `errors` describes every problem found, by line."""
+
+    def __init__(self, errors: list[str]):
+        super().__init__(f"{len(errors)} invalid lines")
+        self.errors = errors
+
+
+@dataclass(frozen=True)
+class BulkRecord:
+    type: str
+    guild_id: int
+    user_id: int | None = None
+    channel_id: int | None = None
+    source_key: str | None = None
+
+    @property
+    def key(self) -> tuple:
+        """What the record sets, a file may only set each key once."""
+        return (self.type, self.guild_id, self.user_id)
+
+    @property
+    def value(self) -> int | str:
+        return self.channel_id if self.type == "channel" else self.source_key
+
+    def describe(self) -> str:
+        target = f"guild {self.guild_id}" + (f" user {self.user_id}" if self.user_id else "")
+        return f"{self.type} {target}"
+
+
+def _parse_row(row: dict) -> BulkRecord:
+    record_type = str(row.get("type") or "").strip()
+    if record_type not in RECORD_TYPES:
+        msg = f"unknown type {record_type!r}, was expecting one of {', '.join(RECORD_TYPES)}"
+        raise ValueError(msg)
+
+    values = {}
+    for name in ("guild_id", *RECORD_TYPES[record_type]):
+        value = row.get(name)
+        if value is None or str(value).strip() == "":
+            msg = f"missing {name}"
+            raise ValueError(msg)
+        if name == "source_key":
+            values[name] = str(value).strip()
+            continue
+        try:
+            values[name] = int(str(value).strip())
+        except ValueError:
+            msg = f"{name} {value!r} is not an ID"
+            raise ValueError(msg) from None
+        if values[name] <= 0:
+            msg = f"{name} {value!r} is not an ID"
+            raise ValueError(msg)
+    return BulkRecord(record_type, **values)
+
+
+def _rows(data: str, file_format: str) -> Iterator[tuple[int, dict | None]]:
+    if file_format == "csv":
+        reader = csv.DictReader(io.StringIO(data))
+        missing = {"type", "guild_id"} - set(reader.fieldnames or ())
+        if missing:
+            raise BulkImportError([f"line 1: the header is missing {', '.join(sorted(missing))}"])
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_num, line in enumerate(data.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            row = None
+        yield line_num, row if isinstance(row, dict) else None
+
+
+def parse_records(data: bytes, file_format: str) -> list[BulkRecord]:
+    """Parse and validate a whole file, raises `BulkImportError` listing every invalid line."""
+    if file_format not in FORMATS:
+        msg = f"Invalid format {file_format}, was expecting one of {', '.join(FORMATS)}"
+        raise ValueError(msg)
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise BulkImportError(["the file is not UTF-8"]) from None
+
+    records = []
+    errors = []
+    seen: dict[tuple, int] = {}
+    for line_num, row in _rows(text, file_format):
+        if row is None:
+            errors.append(f"line {line_num}: not a JSON object")
+            continue
+        try:
+            record = _parse_row(row)
+        except ValueError as e:
+            errors.append(f"line {line_num}: {e}")
+            continue
+        if record.key in seen:
+            errors.append(f"line {line_num}: {record.describe()} is already set on line {seen[record.key]}")
+            continue
+        seen[record.key] = line_num
+        records.append(record)
+
+    if errors:
+        raise BulkImportError(errors)
+    return records
+
+
+def changed_records(records: list[BulkRecord], current: dict[tuple, int | str]) -> list[BulkRecord]:
+    """Records that add or change a value in `current` (`BulkRecord.key` -> value)."""
+    return [record for record in records if current.get(record.key) != record.value]
+
+
+def diff_lines(records: list[BulkRecord], current: dict[tuple, int | str]) -> list[str]:
+    """Describe changed records as "+" (added) or "~" (updated, old -> new) lines."""
+    lines = []
+    for record in records:
+        old = current.get(record.key)
+        if old is None:
+            lines.append(f"+ {record.describe()}: {record.value}")
+        else:
+            lines.append(f"~ {record.describe()}: {old} -> {record.value}")
+    return lines
+
+
+def format_header(file_format: str) -> str:
+    return ",".join(FIELDS) + "\n" if file_format == "csv" else ""
+
+
+def format_record(record: BulkRecord, file_format: str) -> str:
+    """Serialize a record as one line, files start with `format_header`."""
+    row = {name: getattr(record, name) for name in FIELDS}
+    if file_format == "csv":
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator="\n").writerow(["" if value is None else value for value in row.values()])
+        return buffer.getvalue()
+    return json.dumps({name: value for name, value in row.items() if value is not None}) + "\n"
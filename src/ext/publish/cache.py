@@ -0,0 +1,101 @@
+import time
+from collections import OrderedDict
+from collections import deque
+from collections.abc import Callable
+from collections.abc import Hashable
+
+MISSING = object()
+
+
+class LRUCache:
+    """Size-bounded LRU cache whose entries also expire after `ttl` seconds.
+
+    `None` is a valid cached value, use `MISSING` to tell a miss apart from a cached negative result.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict[Hashable, tuple[float, object]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def configure(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._evict()
+
+    def get(self, key: Hashable):
+        entry = self._data.get(key)
+        if entry is None:
+            return MISSING
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return MISSING
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        self._evict()
+
+    def invalidate(self, key: Hashable):
+        self._data.pop(key, None)
+
+    def invalidate_where(self, predicate: Callable[[Hashable], bool]):
+        for key in [key for key in self._data if predicate(key)]:
+            del self._data[key]
+
+    def clear(self):
+        self._data.clear()
+
+    def _evict(self):
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+
+class RecentIds:
+    """Fixed-size window of recently seen IDs, the oldest ID is forgotten once `maxsize` newer ones were added.
+
+    A `maxsize` of 0 disables the window, every ID is new.
+    """
+
+    def __init__(self, maxsize: int = 50_000):
+        self._ring: deque[int] = deque(maxlen=maxsize)
+        # ring slots per ID, a discarded and re-added ID has a stale slot that must not evict the newer one
+        self._slots: dict[int, int] = {}
+        self._ids: set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __contains__(self, item: int) -> bool:
+        return item in self._ids
+
+    def add(self, item: int) -> bool:
+        """Add an ID, returns False if it was already in the window."""
+        if item in self._ids:
+            return False
+        if not self._ring.maxlen:
+            return True
+        if len(self._ring) == self._ring.maxlen:
+            self._evict(self._ring[0])
+        self._ring.append(item)
+        self._slots[item] = self._slots.get(item, 0) + 1
+        self._ids.add(item)
+        return True
+
+    def discard(self, item: int):
+        """Forget an ID early, e.g. when publishing it failed and it may be sent again."""
+        self._ids.discard(item)
+
+    def _evict(self, item: int):
+        self._slots[item] -= 1
+        if not self._slots[item]:
+            del self._slots[item]
+            self._ids.discard(item)
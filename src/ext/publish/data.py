@@ -1,12 +1,30 @@
+import time
+from collections.abc import AsyncIterator
+
 from sqlalchemy import BigInteger
 from sqlalchemy import Column
+from sqlalchemy import Float
+from sqlalchemy import Index
 from sqlalchemy import Integer
 from sqlalchemy import String
 from sqlalchemy import delete
+from sqlalchemy import func
+from sqlalchemy import insert
 from sqlalchemy import select
+from sqlalchemy import union_all
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database import Base
+from metrics import timed_query
+
+from .bulk import BulkRecord
+from .cache import MISSING
+from .cache import LRUCache
+
+# (guild_id, user_id) -> resolved source key, including negative results
+source_key_cache = LRUCache()
 
 
 class GuildPublishingChannel(Base):
@@ -28,53 +46,120 @@ class GuildUserSourceKeyOverride(Base):
     user_id = Column(BigInteger)
     source_key = Column(String, nullable=False)
 
+    __table_args__ = (
+        Index("ux_guild_user_source_key_override_guild_user", "guild_id", "user_id", unique=True),
+    )
+
+
+class GuildPublishDestination(Base):
+    __tablename__ = "guild_publish_destination"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    guild_id = Column(BigInteger, nullable=False)
+    name = Column(String, nullable=False)
+    url = Column(String, nullable=False)
+    api_key = Column(String)
+
+    __table_args__ = (Index("ux_guild_publish_destination_guild_name", "guild_id", "name", unique=True),)
+
+
+class GuildPublishSchedule(Base):
+    __tablename__ = "guild_publish_schedule"
+    guild_id = Column(BigInteger, primary_key=True)
+    weight = Column(Integer)  # jobs served per round robin turn, NULL uses the default
+    max_in_flight = Column(Integer)  # 0 is unlimited, NULL uses the default
+
+
+class PublishOutbox(Base):
+    __tablename__ = "publish_outbox"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    payload = Column(String, nullable=False)  # serialized `PublishJob`
+    guild_id = Column(BigInteger)
+    turn = Column(Float)  # claim order, guilds take turns by weight, see `add_outbox_entries`
+    status = Column(String, nullable=False, default="pending")  # pending, in_flight or dead
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(Float, nullable=False)  # unix timestamp
+    claimed_until = Column(Float)  # lease on in_flight rows, expired leases are claimed again
+    created_at = Column(Float, nullable=False)
+
+    __table_args__ = (
+        Index("ix_publish_outbox_status_turn", "status", "turn"),
+        Index("ix_publish_outbox_guild_turn", "guild_id", "turn"),
+    )
+
+
+class BackfillCheckpoint(Base):
+    __tablename__ = "backfill_checkpoint"
+    channel_id = Column(BigInteger, primary_key=True)
+    guild_id = Column(BigInteger, nullable=False)
+    last_message_id = Column(BigInteger)  # newest message already submitted, history resumes after it
+    published = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    status = Column(String, nullable=False, default="running")  # running, done, failed or stopped
+
 
 async def get_source_key(session: AsyncSession, user_id: int | None = None, guild_id: int | None = None) -> str | None:
     """Get the source key for a user override or the guild default."""
     if not guild_id:
         return None
 
+    cached = source_key_cache.get((guild_id, user_id))
+    if cached is not MISSING:
+        return cached
+
+    source_key = await _resolve_source_key(session, guild_id, user_id)
+    source_key_cache.set((guild_id, user_id), source_key)
+    return source_key
+
+
+@timed_query
+async def _resolve_source_key(session: AsyncSession, guild_id: int, user_id: int | None) -> str | None:
+    # resolve the override and the guild default in a single round-trip
+    guild_default = select(GuildSourceKey.source_key).where(GuildSourceKey.guild_id == guild_id).scalar_subquery()
     if user_id:
-        result = await session.execute(
-            select(GuildUserSourceKeyOverride.source_key).where(
+        override = (
+            select(GuildUserSourceKeyOverride.source_key)
+            .where(
                 GuildUserSourceKeyOverride.guild_id == guild_id,
                 GuildUserSourceKeyOverride.user_id == user_id,
-            ),
+            )
+            .limit(1)
+            .scalar_subquery()
         )
-        row = result.scalar_one_or_none()
-        if row:
-            return row
+        stmt = select(func.coalesce(override, guild_default))
+    else:
+        stmt = select(guild_default)
 
-    result = await session.execute(
-        select(GuildSourceKey.source_key).where(GuildSourceKey.guild_id == guild_id),
-    )
-    row = result.scalar_one_or_none()
-    return row.source_key if row else None
+    return (await session.execute(stmt)).scalar()
 
 
-async def set_source_key(session: AsyncSession, guild_id: int, source_key: str, user_id: int | None = None) -> None:
-    """Set the source key for a user override or the guild default."""
-    model = GuildUserSourceKeyOverride if user_id else GuildSourceKey
-    filters = [
-        model.guild_id == guild_id,
-    ]
+def _invalidate_source_key(guild_id: int, user_id: int | None):
     if user_id:
-        filters.append(model.user_id == user_id)
+        source_key_cache.invalidate((guild_id, user_id))
+    else:
+        # every user in the guild may fall back to the guild default
+        source_key_cache.invalidate_where(lambda key: key[0] == guild_id)
 
-    result = await session.execute(select(model).where(*filters))
-    instance = result.scalar_one_or_none()
 
-    if instance:
-        instance.source_key = source_key
+@timed_query
+async def set_source_key(session: AsyncSession, guild_id: int, source_key: str, user_id: int | None = None) -> None:
+    """Set the source key for a user override or the guild default."""
+    if user_id:
+        stmt = sqlite_insert(GuildUserSourceKeyOverride).values(
+            guild_id=guild_id,
+            user_id=user_id,
+            source_key=source_key,
+        )
+        stmt = stmt.on_conflict_do_update(index_elements=["guild_id", "user_id"], set_={"source_key": source_key})
     else:
-        data = {"guild_id": guild_id, "source_key": source_key}
-        if user_id:
-            data["user_id"] = user_id
-        session.add(model(**data))
+        stmt = sqlite_insert(GuildSourceKey).values(guild_id=guild_id, source_key=source_key)
+        stmt = stmt.on_conflict_do_update(index_elements=["guild_id"], set_={"source_key": source_key})
 
+    await session.execute(stmt)
     await session.commit()
+    _invalidate_source_key(guild_id, user_id)
 
 
+@timed_query
 async def get_all_source_keys(session: AsyncSession, guild_id: int | None = None) -> list[GuildSourceKey]:
     """Get all guild source key entries, or filter by guild_id if provided."""
     stmt = select(GuildSourceKey)
@@ -84,6 +169,7 @@ async def get_all_source_keys(session: AsyncSession, guild_id: int | None = None
     return [el.source_key for el in result.scalars().all()]
 
 
+@timed_query
 async def clear_source_key(session: AsyncSession, guild_id: int, user_id: int | None = None) -> None:
     """Delete the source key entry for a user override or guild default."""
     model = GuildUserSourceKeyOverride if user_id else GuildSourceKey
@@ -93,8 +179,10 @@ async def clear_source_key(session: AsyncSession, guild_id: int, user_id: int |
 
     await session.execute(delete(model).where(*filters))
     await session.commit()
+    _invalidate_source_key(guild_id, user_id)
 
 
+@timed_query
 async def get_guild_publishing_channel(session: AsyncSession, guild_id: int) -> GuildPublishingChannel | None:
     stmt = select(GuildPublishingChannel).where(GuildPublishingChannel.guild_id == guild_id)
     result = await session.execute(stmt)
@@ -102,18 +190,289 @@ async def get_guild_publishing_channel(session: AsyncSession, guild_id: int) ->
     return row.channel_id if row else None
 
 
+@timed_query
+async def get_all_publishing_channels(session: AsyncSession) -> dict[int, int]:
+    """Get every guild's publishing channel as a guild_id -> channel_id map."""
+    result = await session.execute(select(GuildPublishingChannel.guild_id, GuildPublishingChannel.channel_id))
+    return dict(result.tuples().all())
+
+
+@timed_query
 async def set_guild_publishing_channel(session: AsyncSession, guild_id: int, channel_id: int) -> None:
-    stmt = select(GuildPublishingChannel).where(GuildPublishingChannel.guild_id == guild_id)
-    result = await session.execute(stmt)
-    row = result.scalar_one_or_none()
-    if row:
-        row.channel_id = channel_id
-    else:
-        session.add(GuildPublishingChannel(guild_id=guild_id, channel_id=channel_id))
+    stmt = sqlite_insert(GuildPublishingChannel).values(guild_id=guild_id, channel_id=channel_id)
+    stmt = stmt.on_conflict_do_update(index_elements=["guild_id"], set_={"channel_id": channel_id})
+    await session.execute(stmt)
     await session.commit()
 
 
+@timed_query
 async def delete_guild_publishing_channel(session: AsyncSession, guild_id: int) -> None:
     stmt = delete(GuildPublishingChannel).where(GuildPublishingChannel.guild_id == guild_id)
     await session.execute(stmt)
     await session.commit()
+
+
+@timed_query
+async def get_all_publish_destinations(session: AsyncSession) -> list[GuildPublishDestination]:
+    result = await session.execute(
+        select(GuildPublishDestination).order_by(GuildPublishDestination.guild_id, GuildPublishDestination.name),
+    )
+    return list(result.scalars().all())
+
+
+@timed_query
+async def set_publish_destination(
+    session: AsyncSession,
+    guild_id: int,
+    name: str,
+    url: str,
+    api_key: str | None = None,
+) -> None:
+    """Add a destination for a guild, or replace the guild's destination with the same name."""
+    stmt = sqlite_insert(GuildPublishDestination).values(guild_id=guild_id, name=name, url=url, api_key=api_key)
+    stmt = stmt.on_conflict_do_update(index_elements=["guild_id", "name"], set_={"url": url, "api_key": api_key})
+    await session.execute(stmt)
+    await session.commit()
+
+
+@timed_query
+async def delete_publish_destination(session: AsyncSession, guild_id: int, name: str | None = None) -> int:
+    """Delete one of a guild's destinations, or all of them without a name, returns how many were deleted."""
+    stmt = delete(GuildPublishDestination).where(GuildPublishDestination.guild_id == guild_id)
+    if name:
+        stmt = stmt.where(GuildPublishDestination.name == name)
+    result = await session.execute(stmt)
+    await session.commit()
+    return result.rowcount
+
+
+@timed_query
+async def get_bulk_state(session: AsyncSession) -> dict[tuple, int | str]:
+    """Every publishing channel, guild source key and user override as `BulkRecord.key` -> value."""
+    state: dict[tuple, int | str] = {}
+    result = await session.execute(select(GuildPublishingChannel.guild_id, GuildPublishingChannel.channel_id))
+    for guild_id, channel_id in result.tuples():
+        state[("channel", guild_id, None)] = channel_id
+    result = await session.execute(select(GuildSourceKey.guild_id, GuildSourceKey.source_key))
+    for guild_id, source_key in result.tuples():
+        state[("guild_key", guild_id, None)] = source_key
+    result = await session.execute(
+        select(
+            GuildUserSourceKeyOverride.guild_id,
+            GuildUserSourceKeyOverride.user_id,
+            GuildUserSourceKeyOverride.source_key,
+        ),
+    )
+    for guild_id, user_id, source_key in result.tuples():
+        state[("user_key", guild_id, user_id)] = source_key
+    return state
+
+
+async def stream_bulk_records(session: AsyncSession) -> AsyncIterator[BulkRecord]:
+    """Yield every publishing channel, guild source key and user override without loading them all at once."""
+    result = await session.stream(
+        select(GuildPublishingChannel.guild_id, GuildPublishingChannel.channel_id).order_by(
+            GuildPublishingChannel.guild_id,
+        ),
+    )
+    async for guild_id, channel_id in result.tuples():
+        yield BulkRecord("channel", guild_id, channel_id=channel_id)
+
+    result = await session.stream(
+        select(GuildSourceKey.guild_id, GuildSourceKey.source_key).order_by(GuildSourceKey.guild_id),
+    )
+    async for guild_id, source_key in result.tuples():
+        yield BulkRecord("guild_key", guild_id, source_key=source_key)
+
+    result = await session.stream(
+        select(
+            GuildUserSourceKeyOverride.guild_id,
+            GuildUserSourceKeyOverride.user_id,
+            GuildUserSourceKeyOverride.source_key,
+        ).order_by(GuildUserSourceKeyOverride.guild_id, GuildUserSourceKeyOverride.user_id),
+    )
+    async for guild_id, user_id, source_key in result.tuples():
+        yield BulkRecord("user_key", guild_id, user_id=user_id, source_key=source_key)
+
+
+@timed_query
+async def bulk_upsert(session: AsyncSession, records: list[BulkRecord]) -> None:
+    """Upsert publishing channels and source keys with one statement per table, in a single transaction."""
+    channels = [{"guild_id": r.guild_id, "channel_id": r.channel_id} for r in records if r.type == "channel"]
+    guild_keys = [{"guild_id": r.guild_id, "source_key": r.source_key} for r in records if r.type == "guild_key"]
+    user_keys = [
+        {"guild_id": r.guild_id, "user_id": r.user_id, "source_key": r.source_key}
+        for r in records
+        if r.type == "user_key"
+    ]
+
+    if channels:
+        stmt = sqlite_insert(GuildPublishingChannel)
+        stmt = stmt.on_conflict_do_update(index_elements=["guild_id"], set_={"channel_id": stmt.excluded.channel_id})
+        await session.execute(stmt, channels)
+    if guild_keys:
+        stmt = sqlite_insert(GuildSourceKey)
+        stmt = stmt.on_conflict_do_update(index_elements=["guild_id"], set_={"source_key": stmt.excluded.source_key})
+        await session.execute(stmt, guild_keys)
+    if user_keys:
+        stmt = sqlite_insert(GuildUserSourceKeyOverride)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["guild_id", "user_id"],
+            set_={"source_key": stmt.excluded.source_key},
+        )
+        await session.execute(stmt, user_keys)
+    await session.commit()
+
+    # overrides and guild defaults both changed, cheaper to start over than to invalidate guild by guild
+    source_key_cache.clear()
+
+
+@timed_query
+async def get_all_guild_schedules(session: AsyncSession) -> list[GuildPublishSchedule]:
+    result = await session.execute(select(GuildPublishSchedule))
+    return list(result.scalars().all())
+
+
+@timed_query
+async def set_guild_schedule(session: AsyncSession, guild_id: int, **values) -> None:
+    """Set a guild's `weight` and/or `max_in_flight`, leaving the other as it was."""
+    stmt = sqlite_insert(GuildPublishSchedule).values(guild_id=guild_id, **values)
+    stmt = stmt.on_conflict_do_update(index_elements=["guild_id"], set_=values)
+    await session.execute(stmt)
+    await session.commit()
+
+
+@timed_query
+async def add_outbox_entries(
+    session: AsyncSession,
+    entries: list[tuple[str, int | None]],
+    default_weight: int = 1,
+) -> None:
+    """Insert (serialized job, guild ID) entries into the outbox in a single transaction.
+
+    Entries are claimed in `turn` order. A guild's entries are spaced 1 / weight turns apart after its last entry,
+    and a guild without pending entries starts at the oldest pending turn, so guilds take turns like in `FairQueue`
+    (a guild gets its `GuildPublishSchedule.weight`, or `default_weight`, entries per turn) and a guild with a large
+    backlog can't hold back the others.
+    """
+    now = time.time()
+    guild_ids = {guild_id for _, guild_id in entries}
+    weights = await session.execute(
+        select(GuildPublishSchedule.guild_id, GuildPublishSchedule.weight).where(
+            GuildPublishSchedule.guild_id.in_(guild_ids),
+            GuildPublishSchedule.weight.is_not(None),
+        ),
+    )
+    weights = dict(weights.tuples().all())
+    last_turns = await session.execute(
+        select(PublishOutbox.guild_id, func.max(PublishOutbox.turn))
+        .where(PublishOutbox.guild_id.in_(guild_ids))
+        .group_by(PublishOutbox.guild_id),
+    )
+    last_turns = dict(last_turns.tuples().all())
+    current = await session.scalar(select(func.min(PublishOutbox.turn)).where(PublishOutbox.status == "pending"))
+
+    turns = {guild_id: max(current or 0.0, last_turns.get(guild_id) or 0.0) for guild_id in guild_ids}
+    rows = []
+    for payload, guild_id in entries:
+        turns[guild_id] += 1 / max(1, weights.get(guild_id, default_weight))
+        rows.append(
+            {
+                "payload": payload,
+                "guild_id": guild_id,
+                "turn": turns[guild_id],
+                "next_attempt_at": now,
+                "created_at": now,
+            },
+        )
+    await session.execute(insert(PublishOutbox), rows)
+    await session.commit()
+
+
+@timed_query
+async def claim_outbox_entries(session: AsyncSession, limit: int, lease: float) -> list[tuple[int, str, int]]:
+    """Claim up to `limit` due entries for `lease` seconds in `turn` order, returns (id, payload, attempts) tuples.
+
+    Pending and expired entries are each read in index order and stop at `limit`, so a claim doesn't depend on the
+    size of the backlog. Claiming is a single UPDATE so concurrent dispatchers never claim the same row.
+    """
+    now = time.time()
+    candidates = [
+        select(PublishOutbox.id, PublishOutbox.turn)
+        .where(PublishOutbox.status == status, condition)
+        .order_by(PublishOutbox.turn, PublishOutbox.id)
+        .limit(limit)
+        .subquery()
+        for status, condition in (
+            ("pending", PublishOutbox.next_attempt_at <= now),
+            ("in_flight", PublishOutbox.claimed_until < now),
+        )
+    ]
+    due = union_all(*(select(candidate) for candidate in candidates)).subquery()
+    claimed = select(due.c.id).order_by(due.c.turn, due.c.id).limit(limit)
+    stmt = (
+        update(PublishOutbox)
+        .where(PublishOutbox.id.in_(claimed))
+        .values(status="in_flight", claimed_until=now + lease)
+        .returning(PublishOutbox.id, PublishOutbox.payload, PublishOutbox.attempts)
+        .execution_options(synchronize_session=False)
+    )
+    result = await session.execute(stmt)
+    rows = result.tuples().all()
+    await session.commit()
+    return sorted(rows)
+
+
+@timed_query
+async def settle_outbox_entries(
+    session: AsyncSession,
+    completed: list[int],
+    retries: list[dict],
+) -> None:
+    """Delete completed entries and reschedule or dead-letter failed ones in a single transaction.
+
+    `retries` are `{"id", "status", "attempts", "next_attempt_at"}` dicts.
+    """
+    if completed:
+        await session.execute(delete(PublishOutbox).where(PublishOutbox.id.in_(completed)))
+    if retries:
+        await session.execute(
+            update(PublishOutbox),
+            [{**retry, "claimed_until": None} for retry in retries],
+        )
+    await session.commit()
+
+
+@timed_query
+async def get_backfill_checkpoint(session: AsyncSession, channel_id: int) -> BackfillCheckpoint | None:
+    result = await session.execute(select(BackfillCheckpoint).where(BackfillCheckpoint.channel_id == channel_id))
+    return result.scalar_one_or_none()
+
+
+@timed_query
+async def get_running_backfills(session: AsyncSession) -> list[BackfillCheckpoint]:
+    result = await session.execute(select(BackfillCheckpoint).where(BackfillCheckpoint.status == "running"))
+    return list(result.scalars().all())
+
+
+@timed_query
+async def save_backfill_checkpoint(  # noqa: PLR0913
+    session: AsyncSession,
+    channel_id: int,
+    guild_id: int,
+    *,
+    last_message_id: int | None,
+    published: int,
+    failed: int,
+    status: str = "running",
+) -> None:
+    values = {
+        "last_message_id": last_message_id,
+        "published": published,
+        "failed": failed,
+        "status": status,
+    }
+    stmt = sqlite_insert(BackfillCheckpoint).values(channel_id=channel_id, guild_id=guild_id, **values)
+    stmt = stmt.on_conflict_do_update(index_elements=["channel_id"], set_=values)
+    await session.execute(stmt)
+    await session.commit()
@@ -0,0 +1,59 @@
+"""JSON encoders and request body compression for the publish endpoint.
+
+orjson and zstandard are optional, the stdlib `json` encoder and gzip are used when they aren't installed.
+"""
+
+import gzip
+import json
+import logging
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger("discord-aggregator")
+
+ENCODERS = ("auto", "orjson", "json")
+COMPRESSIONS = ("none", "gzip", "zstd")
+
+
+def _json_dumps(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def get_encoder(name: str = "auto"):
+    """Return a function that encodes an object to JSON bytes, preferring orjson for "auto"."""
+    if name not in ENCODERS:
+        msg = f"Invalid encoder {name}, was expecting one of {', '.join(ENCODERS)}"
+        raise ValueError(msg)
+
+    if name in ("auto", "orjson") and orjson:
+        return orjson.dumps
+    if name == "orjson":
+        logger.warning("orjson is not installed, falling back to the json encoder.")
+    return _json_dumps
+
+
+def resolve_compression(name: str = "none") -> str:
+    if name not in COMPRESSIONS:
+        msg = f"Invalid compression {name}, was expecting one of {', '.join(COMPRESSIONS)}"
+        raise ValueError(msg)
+
+    if name == "zstd" and not zstandard:
+        logger.warning("zstandard is not installed, falling back to gzip compression.")
+        return "gzip"
+    return name
+
+
+def compress(body: bytes, method: str) -> bytes:
+    if method == "gzip":
+        return gzip.compress(body, compresslevel=6)
+    if method == "zstd":
+        return zstandard.ZstdCompressor().compress(body)
+    return body
@@ -1,83 +1,496 @@
-import http
+import asyncio
+import contextlib
+import io
 import logging
+import tempfile
+import time
 
-import aiohttp
 import discord
 from discord import app_commands
 from discord.ext import commands
 
+import metrics
 from configurable_cog import ConfigurableCog
+from database import ensure_tables
 from database import get_async_session
 
+from .backfill import Backfill
+from .bulk import FORMATS
+from .bulk import BulkImportError
+from .bulk import changed_records
+from .bulk import diff_lines
+from .bulk import format_header
+from .bulk import format_record
+from .bulk import parse_records
+from .cache import RecentIds
+from .data import bulk_upsert
 from .data import clear_source_key
 from .data import delete_guild_publishing_channel
+from .data import delete_publish_destination
+from .data import get_all_guild_schedules
+from .data import get_all_publish_destinations
+from .data import get_all_publishing_channels
 from .data import get_all_source_keys
-from .data import get_guild_publishing_channel
+from .data import get_backfill_checkpoint
+from .data import get_bulk_state
+from .data import get_running_backfills
 from .data import get_source_key
 from .data import set_guild_publishing_channel
+from .data import set_guild_schedule
+from .data import set_publish_destination
 from .data import set_source_key
+from .data import source_key_cache
+from .data import stream_bulk_records
+from .outbox import OutboxDispatcher
+from .outbox import store_jobs
+from .pipeline import PublishJob
+from .pipeline import PublishQueue
+from .pipeline import publish_jobs
+from .publisher import Destination
+from .publisher import Publisher
+from .publisher import group_destinations
 
-default_settings = {"publish_url": "https://example.com/publish"}
+PUBLISH_MODES = ("inline", "gateway")
+
+default_settings = {
+    # "inline" publishes from the bot process, "gateway" only stores jobs in the outbox and leaves publishing to
+    # `publisher_worker.py` processes, so slow endpoints and publishing CPU never delay gateway heartbeats
+    "publish_mode": "inline",
+    "publish_url": "https://example.com/publish",
+    # connection pool for the publisher client
+    "publish_pool_limit": 100,
+    "publish_pool_limit_per_host": 20,
+    "publish_keepalive_timeout": 30.0,
+    "publish_dns_cache_ttl": 300,
+    "publish_timeout": 10.0,
+    "publish_connect_timeout": 5.0,
+    # request bodies, encoder is "auto" (orjson when installed) or "json", compression is "none", "gzip" or "zstd"
+    # and only applies to bodies of at least `publish_compression_threshold` bytes
+    "publish_encoder": "auto",
+    "publish_compression": "none",
+    "publish_compression_threshold": 1024,
+    # publish queue, overflow is one of "block", "drop_oldest" or "reject"
+    "queue_size": 1000,
+    "queue_workers": 4,
+    "queue_overflow": "block",
+    "queue_drain_timeout": 10.0,
+    # per-guild fair scheduling, a guild takes up to its weight in jobs per turn and at most `max_in_flight` jobs
+    # are handled at once (0 is unlimited), both can be set per guild with `manage-guilds weight/cap`
+    "queue_default_weight": 1,
+    "queue_default_max_in_flight": 0,
+    # opt-in batching, sends up to `batch_max_items`/`batch_max_bytes` as one JSON array after `batch_linger` seconds
+    "batch_enabled": False,
+    "batch_max_items": 50,
+    "batch_max_bytes": 256_000,
+    "batch_linger": 0.05,
+    # durable outbox, queued jobs are stored in `publish_outbox` and published by a background dispatcher
+    "outbox_enabled": False,
+    "outbox_insert_batch": 200,
+    "outbox_claim_batch": 100,
+    "outbox_poll_interval": 1.0,
+    "outbox_lease": 60.0,
+    "outbox_max_attempts": 8,
+    "outbox_backoff_base": 1.0,
+    "outbox_backoff_max": 600.0,
+    # requests per second to the publish endpoint (0 disables), adapts to 429/5xx and `Retry-After`
+    "rate_limit": 0.0,
+    "rate_limit_burst": 20,
+    # circuit breaker around the publish endpoint
+    "breaker_failure_threshold": 5,
+    "breaker_reset_timeout": 30.0,
+    "breaker_half_open_max": 1,
+    # publishing channels, destinations and guild schedules are reloaded this often, in seconds, so changes made
+    # through another process (shard processes, publisher workers) apply everywhere
+    "routing_refresh_interval": 30.0,
+    # resolved source keys, including guilds and users without one
+    "source_key_cache_size": 10_000,
+    "source_key_cache_ttl": 300.0,
+    # history backfill, throttled so live traffic keeps most of the endpoint's capacity
+    "backfill_concurrency": 4,
+    "backfill_rate": 5.0,
+    "backfill_page_size": 100,
+    "backfill_report_interval": 5.0,
+    # failed messages are retried with exponential backoff, a message that keeps failing stops the backfill there
+    "backfill_retries": 3,
+    "backfill_retry_delay": 1.0,
+    # largest file `bulk-guilds import` accepts, in bytes
+    "bulk_import_max_size": 10 * 1024 * 1024,
+    # recently published message IDs, duplicates (gateway replays, manual re-publishes) are skipped before sending
+    "dedup_window": 50_000,
+    # per-message publish logs, content is truncated to `log_content_limit` characters and only a
+    # `log_sample_rate` fraction of publishes is logged, failures are always logged
+    "log_content_limit": 200,
+    "log_sample_rate": 1.0,
+    # attachments are streamed from the CDN as a multipart upload (opt-in since it changes the request format),
+    # files over `attachment_max_size` bytes are only described, embeds are sent as `embeds` in the JSON payload
+    "forward_attachments": False,
+    "forward_embeds": True,
+    "attachment_max_size": 25 * 1024 * 1024,
+    "attachment_concurrency": 4,
+}
 logger = logging.getLogger("discord-aggregator")
 
+MESSAGES_SEEN = metrics.counter("bot_publish_messages_seen_total", "Guild messages seen, per guild.", ("guild",))
+MESSAGES_PUBLISHED = metrics.counter(
+    "bot_publish_messages_published_total",
+    "Messages accepted by the publish endpoint, per guild.",
+    ("guild",),
+)
+MESSAGES_FAILED = metrics.counter(
+    "bot_publish_messages_failed_total",
+    "Publish attempts that were not accepted, per guild.",
+    ("guild",),
+)
+QUEUE_DEPTH = metrics.gauge("bot_publish_queue_depth", "Jobs waiting in the publish queue.")
 
-async def _publish(self, url: str, api_key: str, content: str, source_key: str | None = None):
-    logger.info(
-        "Publishing to %s with content: %s for %s",
-        url,
-        content,
-        source_key or "no source key",
-    )
 
-    headers = {
-        "Content-Type": "application/json",
-        "x-api-key": api_key,
-    }
-    package = {
-        "content": content,
-    }
-    if source_key:
-        package["source_key"] = source_key
-
-    async with aiohttp.ClientSession() as session, session.post(url, json=package, headers=headers) as response:
-        if response.status == http.HTTPStatus.OK:
-            logger.info("Successfully published content.")
-        else:
-            text = await response.text()
-            logger.warning("Failed to publish: %s %s", response.status, text)
+def batch_max_items(settings) -> int:
+    return settings.batch_max_items if settings.batch_enabled else 1
+
+
+async def load_destinations() -> dict[int, list[Destination]]:
+    async with get_async_session() as session:
+        rows = await get_all_publish_destinations(session)
+    return group_destinations(rows)
+
+
+async def send_jobs(
+    publisher: Publisher,
+    jobs: list[PublishJob],
+    destinations: dict[int, list[Destination]],
+    settings,
+) -> list[bool]:
+    """Publish jobs to their guild's destinations and count the results, shared by the bot and publisher workers."""
+    results = await publish_jobs(
+        publisher,
+        jobs,
+        batch_max_items=batch_max_items(settings),
+        destinations=lambda job: destinations.get(job.guild_id, []),
+    )
+    for job, published in zip(jobs, results, strict=True):
+        (MESSAGES_PUBLISHED if published else MESSAGES_FAILED).inc(guild=job.guild_id)
+    return results
 
 
 class Publish(ConfigurableCog):
     def __init__(self, bot, **kwargs):
         super().__init__(bot, "publish", default_settings, **kwargs)
+        # guild_id -> channel_id, mirrors `GuildPublishingChannel` so `on_message` never queries for routing
+        self.publishing_channels: dict[int, int] = {}
+        # guild_id -> destinations, mirrors `GuildPublishDestination`, guilds without any use `publish_url`
+        self.destinations: dict[int, list[Destination]] = {}
+        # guild_id -> scheduling overrides, mirror `GuildPublishSchedule` and are read live by the queue
+        self.guild_weights: dict[int, int] = {}
+        self.guild_max_in_flight: dict[int, int] = {}
+        self.publisher: Publisher | None = None
+        self.queue: PublishQueue | None = None
+        self.outbox: OutboxDispatcher | None = None
+        self.recent_ids: RecentIds | None = None
+        # channel_id -> running backfill and its task
+        self.backfills: dict[int, tuple[Backfill, asyncio.Task]] = {}
+        self._resume_task: asyncio.Task | None = None
+        self._refresh_task: asyncio.Task | None = None
+        # held while the routing state above is reloaded or written, so a reload that read the database before a
+        # command's write committed can't replace the command's change with the older state
+        self._routing_lock = asyncio.Lock()
+
+    async def cog_load(self):
+        super().cog_load()
+        if self.settings.publish_mode not in PUBLISH_MODES:
+            msg = f"Invalid publish_mode {self.settings.publish_mode}, was expecting one of {', '.join(PUBLISH_MODES)}"
+            raise ValueError(msg)
+
+        await ensure_tables()
+        await self._load_channels()
+        await self._load_destinations()
+        await self._load_schedules()
+        source_key_cache.configure(self.settings.source_key_cache_size, self.settings.source_key_cache_ttl)
+        self.recent_ids = RecentIds(self.settings.dedup_window)
+
+        if self.settings.publish_mode == "gateway":
+            self.logger.info("Publishing to the outbox only, publisher workers send the jobs")
+        else:
+            self.publisher = Publisher.from_settings(self.settings)
+            await self.publisher.start()
+
+        if self.settings.outbox_enabled and self.publisher:
+            self.outbox = OutboxDispatcher.from_settings(self._send_jobs, self.settings)
+            await self.outbox.start()
+
+        self.queue = PublishQueue(
+            self._store_jobs if self._uses_outbox() else self._send_jobs,
+            on_drop=self._forget_jobs,
+            maxsize=self.settings.queue_size,
+            workers=self.settings.queue_workers,
+            overflow=self.settings.queue_overflow,
+            batch_max_items=(
+                self.settings.outbox_insert_batch if self._uses_outbox() else batch_max_items(self.settings)
+            ),
+            batch_max_bytes=self.settings.batch_max_bytes,
+            batch_linger=self.settings.batch_linger,
+            weights=self.guild_weights,
+            max_in_flight=self.guild_max_in_flight,
+            default_weight=self.settings.queue_default_weight,
+            default_max_in_flight=self.settings.queue_default_max_in_flight,
+        )
+        await self.queue.start()
+        QUEUE_DEPTH.set_function(self.queue.qsize)
+
+        self._resume_task = asyncio.create_task(self._resume_backfills())
+        self._refresh_task = asyncio.create_task(self._refresh_routing(), name="publish-routing-refresh")
+
+    async def cog_unload(self):
+        QUEUE_DEPTH.set_function(None)
+        # backfills keep their "running" checkpoint and resume when the cog loads again
+        tasks = [task for _, task in self.backfills.values()]
+        tasks.extend(task for task in (self._resume_task, self._refresh_task) if task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        # drain queued publishes while the publisher is still open
+        if self.queue:
+            await self.queue.close(self.settings.queue_drain_timeout)
+        if self.outbox:
+            await self.outbox.close(self.settings.queue_drain_timeout)
+        if self.publisher:
+            await self.publisher.close()
+
+    def _uses_outbox(self) -> bool:
+        return self.settings.outbox_enabled or self.settings.publish_mode == "gateway"
+
+    async def _load_channels(self):
+        async with get_async_session() as session:
+            self.publishing_channels = await get_all_publishing_channels(session)
+        self.logger.info("Loaded %d publishing channels", len(self.publishing_channels))
+
+    async def _load_destinations(self):
+        self.destinations = await load_destinations()
+        self.logger.info(
+            "Loaded %d publish destinations for %d guilds",
+            sum(map(len, self.destinations.values())),
+            len(self.destinations),
+        )
+
+    async def _load_schedules(self):
+        async with get_async_session() as session:
+            schedules = await get_all_guild_schedules(session)
+        # the queue holds references to these dicts, so they're updated in place
+        weights = {s.guild_id: s.weight for s in schedules if s.weight is not None}
+        max_in_flight = {s.guild_id: s.max_in_flight for s in schedules if s.max_in_flight is not None}
+        self.guild_weights.clear()
+        self.guild_weights.update(weights)
+        self.guild_max_in_flight.clear()
+        self.guild_max_in_flight.update(max_in_flight)
+
+    async def _refresh_routing(self):
+        while True:
+            await asyncio.sleep(self.settings.routing_refresh_interval)
+            try:
+                async with self._routing_lock:
+                    await self._load_channels()
+                    await self._load_destinations()
+                    await self._load_schedules()
+            except Exception:
+                self.logger.exception("Failed to reload publish routing, keeping the previous state.")
+
+    def _make_job(self, message: discord.Message, source_key: str | None) -> PublishJob:
+        return PublishJob.from_message(
+            message,
+            source_key,
+            attachments=self.settings.forward_attachments,
+            embeds=self.settings.forward_embeds,
+        )
+
+    def _job_destinations(self, job: PublishJob) -> list[Destination]:
+        return self.destinations.get(job.guild_id, [])
+
+    def _forget_jobs(self, jobs: list[PublishJob]):
+        """Forget the messages of jobs that weren't published, to allow a later retry or manual publish."""
+        for job in jobs:
+            if job.message_id:
+                self.recent_ids.discard(job.message_id)
+
+    async def _send_jobs(self, jobs: list[PublishJob]) -> list[bool]:
+        results = await send_jobs(self.publisher, jobs, self.destinations, self.settings)
+        self._forget_jobs([job for job, published in zip(jobs, results, strict=True) if not published])
+        return results
+
+    async def _store_jobs(self, jobs: list[PublishJob]):
+        await store_jobs(jobs, self.settings.queue_default_weight)
+        if self.outbox:
+            self.outbox.notify()
+
+    async def _submit_backfill_jobs(self, jobs: list[PublishJob]) -> list[bool | None]:
+        """Publish or store backfilled jobs, messages published recently are skipped and reported as None."""
+        fresh = [job for job in jobs if self.recent_ids.add(job.message_id)]
+        try:
+            if not fresh:
+                results = []
+            elif self._uses_outbox():
+                await self._store_jobs(fresh)
+                results = [True] * len(fresh)
+            else:
+                results = await self._send_jobs(fresh)
+        except BaseException:
+            # the backfill retries the page, these must not be skipped as published
+            self._forget_jobs(fresh)
+            raise
+        sent = dict(zip(map(id, fresh), results, strict=True))
+        return [sent.get(id(job)) for job in jobs]
+
+    def _start_backfill(self, channel, *, from_start: bool = False, report=None) -> Backfill:
+        backfill = Backfill(
+            channel,
+            self._submit_backfill_jobs,
+            make_job=self._make_job,
+            concurrency=self.settings.backfill_concurrency,
+            rate=self.settings.backfill_rate,
+            page_size=self.settings.backfill_page_size,
+            retries=self.settings.backfill_retries,
+            retry_delay=self.settings.backfill_retry_delay,
+            report=report,
+        )
+        task = asyncio.create_task(backfill.run(from_start=from_start), name=f"backfill-{channel.id}")
+        task.add_done_callback(lambda task: self._backfill_done(channel.id, task))
+        self.backfills[channel.id] = (backfill, task)
+        return backfill
+
+    def _backfill_done(self, channel_id: int, task: asyncio.Task):
+        self.backfills.pop(channel_id, None)
+        if not task.cancelled() and task.exception():
+            self.logger.error("Backfill of channel %d failed", channel_id, exc_info=task.exception())
+
+    async def _resume_backfills(self):
+        await self.bot.wait_until_ready()
+        async with get_async_session() as session:
+            checkpoints = await get_running_backfills(session)
+
+        for checkpoint in checkpoints:
+            # with several shard processes only the one that can see the channel resumes it
+            channel = self.bot.get_channel(checkpoint.channel_id)
+            if channel and checkpoint.channel_id not in self.backfills:
+                self.logger.info("Resuming backfill of channel %d", checkpoint.channel_id)
+                self._start_backfill(channel)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         if not message.guild:
             return
+        MESSAGES_SEEN.inc(guild=message.guild.id)
+        if self.publishing_channels.get(message.guild.id) != message.channel.id:
+            return
+        if not self.recent_ids.add(message.id):
+            self.logger.debug("Skipping message %d, it was published recently", message.id)
+            return
 
         async with get_async_session() as session:
-            channel_id = await get_guild_publishing_channel(session, message.guild.id)
-            if channel_id and message.channel.id == channel_id:
-                source_key = await get_source_key(session, guild_id=message.guild.id, user_id=message.author.id)
-                await _publish(
-                    self,
-                    self.settings.publish_url,
-                    self.settings.publish_api_key,
-                    message.content,
-                    source_key,
-                )
+            source_key = await get_source_key(session, guild_id=message.guild.id, user_id=message.author.id)
+        if not await self.queue.put(self._make_job(message, source_key)):
+            self.recent_ids.discard(message.id)
 
     @app_commands.command()
     @app_commands.default_permissions(administrator=True)
     async def publish(self, interaction: discord.Interaction, message_id: str):
         """Manually publish a message using its link."""
+        await interaction.response.defer(ephemeral=True)
         message = await interaction.channel.fetch_message(message_id)
+        if not self.recent_ids.add(message.id):
+            await interaction.followup.send("This message was already published recently.", ephemeral=True)
+            return
 
         async with get_async_session() as session:
-            content = message.content
             source_key = await get_source_key(session, guild_id=interaction.guild_id)
-            await _publish(self, self.settings.publish_url, content, source_key)
+        job = self._make_job(message, source_key)
+        try:
+            if self.publisher:
+                (published,) = await publish_jobs(self.publisher, [job], destinations=self._job_destinations)
+            else:
+                await self._store_jobs([job])
+        except BaseException:
+            self._forget_jobs([job])
+            raise
+        if not self.publisher:
+            await interaction.followup.send("Message queued for publishing.", ephemeral=True)
+            return
+        if not published:
+            self._forget_jobs([job])
+        await interaction.followup.send(
+            "Message published." if published else "Failed to publish message.",
+            ephemeral=True,
+        )
+
+    @app_commands.command()
+    @app_commands.default_permissions(administrator=True)
+    @app_commands.choices(
+        choices=[
+            app_commands.Choice(name="Start", value="start"),
+            app_commands.Choice(name="Stop", value="stop"),
+            app_commands.Choice(name="Status", value="status"),
+        ],
+    )
+    async def backfill(
+        self,
+        interaction: discord.Interaction,
+        choices: app_commands.Choice[str],
+        from_start: bool = False,  # noqa: FBT001, FBT002
+    ):
+        """Publish the auto-publishing channel's existing messages, resuming where the last backfill stopped."""
+        channel_id = self.publishing_channels.get(interaction.guild_id)
+        if not channel_id:
+            await interaction.response.send_message("Set an auto-publishing channel first.", ephemeral=True)
+            return
+
+        running = self.backfills.get(channel_id)
+        if choices.value == "start":
+            if running:
+                await interaction.response.send_message(running[0].describe(), ephemeral=True)
+                return
+            await self._backfill_start(interaction, channel_id, from_start=from_start)
+
+        elif choices.value == "stop":
+            if not running:
+                await interaction.response.send_message("No backfill is running.", ephemeral=True)
+                return
+            backfill, task = running
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await backfill.stop()
+            await interaction.response.send_message(backfill.describe(), ephemeral=True)
+
+        elif running:
+            await interaction.response.send_message(running[0].describe(), ephemeral=True)
+
+        else:
+            async with get_async_session() as session:
+                checkpoint = await get_backfill_checkpoint(session, channel_id)
+            if not checkpoint:
+                await interaction.response.send_message("This channel has never been backfilled.", ephemeral=True)
+                return
+            await interaction.response.send_message(
+                f"Last backfill {checkpoint.status}: {checkpoint.published} published, {checkpoint.failed} failed.",
+                ephemeral=True,
+            )
+
+    async def _backfill_start(self, interaction: discord.Interaction, channel_id: int, *, from_start: bool):
+        channel = interaction.guild.get_channel(channel_id)
+        if not channel:
+            await interaction.response.send_message("The auto-publishing channel no longer exists.", ephemeral=True)
+            return
+
+        last_report = 0.0
+
+        async def report(backfill: Backfill):
+            nonlocal last_report
+            if time.monotonic() - last_report < self.settings.backfill_report_interval:
+                return
+            last_report = time.monotonic()
+            # the interaction token expires after 15 minutes, the backfill carries on
+            with contextlib.suppress(discord.HTTPException):
+                await interaction.edit_original_response(content=backfill.describe())
+
+        await interaction.response.send_message(f"Starting backfill of {channel.mention}...", ephemeral=True)
+        self._start_backfill(channel, from_start=from_start, report=report)
 
     @app_commands.command(name="manage-auto-publishing")
     @app_commands.default_permissions(administrator=True)
@@ -94,29 +507,57 @@ class Publish(ConfigurableCog):
         channel: discord.TextChannel | None,
     ):
         """Configure your server's auto-publishing (if enabled by root)."""
-        async with get_async_session() as session:
-            if choices.value == "set":
-                if not channel:
-                    await interaction.response.send_message(
-                        "Please specify a channel to set for auto-publishing.",
-                        ephemeral=True,
-                    )
-                    return
-                await set_guild_publishing_channel(session, interaction.guild_id, channel.id)
+        if choices.value == "set":
+            if not channel:
                 await interaction.response.send_message(
-                    f"Auto-publishing channel set to {channel.mention}.",
+                    "Please specify a channel to set for auto-publishing.",
                     ephemeral=True,
                 )
+                return
+            async with self._routing_lock, get_async_session() as session:
+                await set_guild_publishing_channel(session, interaction.guild_id, channel.id)
+                self.publishing_channels[interaction.guild_id] = channel.id
+            await interaction.response.send_message(
+                f"Auto-publishing channel set to {channel.mention}.",
+                ephemeral=True,
+            )
 
-            elif choices.value == "reset":
+        elif choices.value == "reset":
+            async with self._routing_lock, get_async_session() as session:
                 await delete_guild_publishing_channel(session, interaction.guild_id)
-                await interaction.response.send_message(
-                    "Auto-publishing channel reset.",
-                    ephemeral=True,
-                )
+                self.publishing_channels.pop(interaction.guild_id, None)
+            await interaction.response.send_message(
+                "Auto-publishing channel reset.",
+                ephemeral=True,
+            )
 
-            else:
-                await interaction.response.send_message("Invalid choice.", ephemeral=True)
+        else:
+            await interaction.response.send_message("Invalid choice.", ephemeral=True)
+
+    @commands.command(name="publish-status")
+    @commands.is_owner()
+    async def publish_status(self, ctx: commands.Context):
+        """Owner only - Show the publish queue, and the circuit breaker and rate limiter of every endpoint."""
+        lines = [f"Queued jobs: {self.queue.qsize()}"]
+        busiest = sorted(self.queue.guild_sizes().items(), key=lambda item: item[1], reverse=True)[:5]
+        if busiest:
+            lines.append(f"Busiest guilds: {', '.join(f'{guild_id} ({size})' for guild_id, size in busiest)}")
+        if self.publisher:
+            for url, (limiter, breaker) in self.publisher.endpoints().items():
+                lines.append(f"{url}:")
+                lines.append(
+                    f"  Circuit: {breaker.state} ({breaker.failures} consecutive failures, "
+                    f"opened {breaker.total_opens} times)",
+                )
+                if breaker.state != breaker.CLOSED:
+                    lines.append(f"  Retrying in: {breaker.retry_in():.1f}s")
+                if limiter.enabled:
+                    lines.append(f"  Rate limit: {limiter.rate:.1f}/{limiter.max_rate:.1f} requests per second")
+                else:
+                    lines.append("  Rate limit: disabled")
+        else:
+            lines.append("Publishing runs in separate publisher workers, check their logs and metrics.")
+        await ctx.send("\n".join(lines)[:2000])
 
     @commands.command(name="manage-guilds")
     @commands.is_owner()
@@ -168,3 +609,166 @@ class Publish(ConfigurableCog):
 
             else:
                 await ctx.send(f"Invalid action. Use {', '.join(action_list[:-1])} or {action_list[-1]}.")
+
+    @commands.command(name="manage-schedule")
+    @commands.is_owner()
+    async def manage_schedule(self, ctx: commands.Context, action: str, guild_id: str, value: str):
+        """Owner only - Set a guild's publish queue `weight`, or its `cap` on publishes in flight (0 removes it)."""
+        action_list = ["weight", "cap"]
+        try:
+            guild_id = int(guild_id)
+            value = int(value)
+        except ValueError:
+            await ctx.send("Invalid guild ID or value. Please provide valid integers.")
+            return
+
+        if action == "weight":
+            if value < 1:
+                await ctx.send("The weight must be at least 1.")
+                return
+            async with self._routing_lock, get_async_session() as session:
+                await set_guild_schedule(session, guild_id, weight=value)
+                self.guild_weights[guild_id] = value
+            await ctx.send(f"Guild {guild_id} now takes up to {value} queued jobs per turn.")
+
+        elif action == "cap":
+            if value < 0:
+                await ctx.send("The cap can't be negative, use 0 to remove it.")
+                return
+            async with self._routing_lock, get_async_session() as session:
+                await set_guild_schedule(session, guild_id, max_in_flight=value)
+                self.guild_max_in_flight[guild_id] = value
+            await ctx.send(
+                f"Guild {guild_id} is limited to {value} publishes at once."
+                if value
+                else f"Removed the publish limit for guild {guild_id}.",
+            )
+
+        else:
+            await ctx.send(f"Invalid action. Use {' or '.join(action_list)}.")
+
+    @commands.command(name="manage-destinations")
+    @commands.is_owner()
+    async def manage_destinations(  # noqa: PLR0913, PLR0917
+        self,
+        ctx: commands.Context,
+        action: str,
+        guild_id: str,
+        name: str | None = None,
+        url: str | None = None,
+        api_key: str | None = None,
+    ):
+        """Owner only - Manage the endpoints a guild publishes to, guilds without any use the default endpoint."""
+        action_list = ["list", "set", "remove"]
+        try:
+            guild_id = int(guild_id)
+        except ValueError:
+            await ctx.send("Invalid guild ID. Please provide a valid integer.")
+            return
+
+        if action == "list":
+            destinations = self.destinations.get(guild_id)
+            if not destinations:
+                await ctx.send(f"Guild {guild_id} publishes to the default endpoint.")
+                return
+            # never echo credentials back into the channel
+            lines = [f"{d.name}: {d.url}{' (with API key)' if d.api_key else ''}" for d in destinations]
+            await ctx.send("\n".join([f"Destinations for guild {guild_id}:", *lines]))
+            return
+
+        if action == "set":
+            if not name or not url:
+                await ctx.send("Please provide a name and URL for the destination.")
+                return
+            if api_key:
+                # the command message contains the API key
+                with contextlib.suppress(discord.HTTPException):
+                    await ctx.message.delete()
+            async with self._routing_lock:
+                async with get_async_session() as session:
+                    await set_publish_destination(session, guild_id, name, url, api_key)
+                await self._load_destinations()
+            await ctx.send(f"Set destination {name} for guild {guild_id} to {url}.")
+
+        elif action == "remove":
+            async with self._routing_lock:
+                async with get_async_session() as session:
+                    removed = await delete_publish_destination(session, guild_id, name)
+                await self._load_destinations()
+            await ctx.send(f"Removed {removed} destinations for guild {guild_id}.")
+
+        else:
+            await ctx.send(f"Invalid action. Use {', '.join(action_list[:-1])} or {action_list[-1]}.")
+
+    @commands.command(name="bulk-guilds")
+    @commands.is_owner()
+    async def bulk_guilds(self, ctx: commands.Context, action: str, option: str | None = None):
+        """Owner only - Import channels and source keys from an attached .csv/.jsonl file, or export them.
+
+        `import` validates the whole file first and applies it in one transaction, `import dry-run` only reports
+        the changes. `export csv` or `export jsonl` sends everything as a file in the same format.
+        """
+        if action == "import":
+            await self._bulk_import(ctx, dry_run=option == "dry-run")
+        elif action == "export":
+            await self._bulk_export(ctx, option or "csv")
+        else:
+            await ctx.send("Invalid action. Use import or export.")
+
+    async def _bulk_import(self, ctx: commands.Context, *, dry_run: bool):
+        if not ctx.message.attachments:
+            await ctx.send("Please attach a .csv or .jsonl file to import.")
+            return
+        attachment = ctx.message.attachments[0]
+        file_format = attachment.filename.rsplit(".", 1)[-1].lower()
+        if file_format not in FORMATS:
+            await ctx.send("Please attach a .csv or .jsonl file to import.")
+            return
+        if attachment.size > self.settings.bulk_import_max_size:
+            await ctx.send(f"The file is larger than {self.settings.bulk_import_max_size} bytes.")
+            return
+
+        try:
+            records = parse_records(await attachment.read(), file_format)
+        except BulkImportError as e:
+            await ctx.send(
+                f"Nothing was imported, {len(e.errors)} lines are invalid.",
+                file=discord.File(io.BytesIO("\n".join(e.errors).encode()), filename="errors.txt"),
+            )
+            return
+
+        async with self._routing_lock:
+            async with get_async_session() as session:
+                current = await get_bulk_state(session)
+                changed = changed_records(records, current)
+                if changed and not dry_run:
+                    await bulk_upsert(session, changed)
+            if not dry_run:
+                self.publishing_channels.update({r.guild_id: r.channel_id for r in changed if r.type == "channel"})
+
+        if not dry_run:
+            self.logger.info("Imported %d of %d bulk records", len(changed), len(records))
+
+        lines = diff_lines(changed, current)
+        added = sum(line.startswith("+") for line in lines)
+        await ctx.send(
+            f"{'Would change' if dry_run else 'Changed'} {len(changed)} entries ({added} added, "
+            f"{len(changed) - added} updated), {len(records) - len(changed)} unchanged.",
+            file=discord.File(io.BytesIO("\n".join(lines).encode()), filename="diff.txt") if lines else None,
+        )
+
+    async def _bulk_export(self, ctx: commands.Context, file_format: str):
+        if file_format not in FORMATS:
+            await ctx.send(f"Invalid format. Use {' or '.join(FORMATS)}.")
+            return
+
+        # rows are written as they are read, the file only moves to disk once it's over 1 MiB
+        with tempfile.SpooledTemporaryFile(max_size=1024 * 1024) as buffer:
+            buffer.write(format_header(file_format).encode())
+            count = 0
+            async with get_async_session() as session:
+                async for record in stream_bulk_records(session):
+                    buffer.write(format_record(record, file_format).encode())
+                    count += 1
+            buffer.seek(0)
+            await ctx.send(f"Exported {count} entries.", file=discord.File(buffer, filename=f"guilds.{file_format}"))
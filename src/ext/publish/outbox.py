@@ -0,0 +1,155 @@
+import asyncio
+import contextlib
+import logging
+import random
+import time
+from collections.abc import Awaitable
+from collections.abc import Callable
+
+from database import get_async_session
+
+from .data import add_outbox_entries
+from .data import claim_outbox_entries
+from .data import settle_outbox_entries
+from .pipeline import PublishJob
+
+logger = logging.getLogger("discord-aggregator")
+
+
+async def store_jobs(jobs: list[PublishJob], default_weight: int = 1):
+    """Persist jobs to the outbox in one transaction, used as the `PublishQueue` handler in outbox mode."""
+    async with get_async_session() as session:
+        await add_outbox_entries(session, [(job.dumps(), job.guild_id) for job in jobs], default_weight)
+
+
+class OutboxDispatcher:
+    """Background task that claims due outbox entries in batches and publishes them.
+
+    Guilds take turns by their weight, see `add_outbox_entries`. Failed entries are retried with jittered
+    exponential backoff and dead-lettered after `max_attempts`.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        send: Callable[[list[PublishJob]], Awaitable[list[bool]]],
+        *,
+        claim_batch: int = 100,
+        poll_interval: float = 1.0,
+        lease: float = 60.0,
+        max_attempts: int = 8,
+        backoff_base: float = 1.0,
+        backoff_max: float = 600.0,
+    ):
+        self.send = send
+        self.claim_batch = claim_batch
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        self._wakeup = asyncio.Event()
+        self._closing = False
+        self._task: asyncio.Task | None = None
+
+    @classmethod
+    def from_settings(cls, send: Callable[[list[PublishJob]], Awaitable[list[bool]]], settings):
+        return cls(
+            send,
+            claim_batch=settings.outbox_claim_batch,
+            poll_interval=settings.outbox_poll_interval,
+            lease=settings.outbox_lease,
+            max_attempts=settings.outbox_max_attempts,
+            backoff_base=settings.outbox_backoff_base,
+            backoff_max=settings.outbox_backoff_max,
+        )
+
+    def notify(self):
+        """Wake the dispatcher early, e.g. right after new entries were stored."""
+        self._wakeup.set()
+
+    async def start(self):
+        self._closing = False
+        self._task = asyncio.create_task(self._run(), name="publish-outbox-dispatcher")
+
+    async def close(self, timeout: float | None = None):  # noqa: ASYNC109
+        """Let the current dispatch finish for up to `timeout`, unsent entries stay in the outbox."""
+        if not self._task:
+            return
+
+        self._closing = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except TimeoutError:
+            logger.warning("Outbox dispatcher did not stop in time, claimed entries are retried after their lease.")
+        self._task = None
+
+    def backoff(self, attempts: int) -> float:
+        """Full-jitter exponential backoff for an entry that has failed `attempts` times."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1)))  # noqa: S311
+
+    async def dispatch_once(self) -> int:
+        """Claim and publish one batch of due entries, returns how many were claimed."""
+        async with get_async_session() as session:
+            entries = await claim_outbox_entries(session, self.claim_batch, self.lease)
+        if not entries:
+            return 0
+
+        # decode entries one by one, an entry that can't be decoded never will be so it's dead-lettered right away
+        jobs: dict[int, PublishJob] = {}
+        undecodable = set()
+        for entry_id, payload, _ in entries:
+            try:
+                jobs[entry_id] = PublishJob.loads(payload)
+            except (TypeError, ValueError):
+                logger.exception("Outbox entry %d can't be decoded, moving to dead letter.", entry_id)
+                undecodable.add(entry_id)
+
+        # an unexpected error fails the whole batch, it counts as an attempt so the entries still reach dead letter
+        try:
+            sent = await self.send(list(jobs.values())) if jobs else []
+        except Exception:
+            logger.exception("Unexpected error while publishing %d outbox entries.", len(jobs))
+            sent = [False] * len(jobs)
+        results = dict(zip(jobs, sent, strict=True))
+
+        completed = []
+        retries = []
+        now = time.time()
+        for entry_id, _, attempts in entries:
+            if results.get(entry_id):
+                completed.append(entry_id)
+                continue
+
+            attempts += 1  # noqa: PLW2901
+            if entry_id in undecodable or attempts >= self.max_attempts:
+                logger.warning("Outbox entry %d failed %d times, moving to dead letter.", entry_id, attempts)
+                retries.append({"id": entry_id, "status": "dead", "attempts": attempts, "next_attempt_at": now})
+            else:
+                retries.append(
+                    {
+                        "id": entry_id,
+                        "status": "pending",
+                        "attempts": attempts,
+                        "next_attempt_at": now + self.backoff(attempts),
+                    },
+                )
+
+        async with get_async_session() as session:
+            await settle_outbox_entries(session, completed, retries)
+        return len(entries)
+
+    async def _run(self):
+        while not self._closing:
+            self._wakeup.clear()
+            try:
+                claimed = await self.dispatch_once()
+            except Exception:
+                logger.exception("Unexpected error while dispatching the outbox.")
+                claimed = 0
+
+            # keep going while there is a backlog, otherwise wait for new entries or the next poll
+            if claimed < self.claim_batch and not self._closing:
+                with contextlib.suppress(TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
@@ -0,0 +1,279 @@
+import asyncio
+import dataclasses
+import json
+import logging
+from collections.abc import Awaitable
+from collections.abc import Callable
+from dataclasses import dataclass
+from dataclasses import field
+
+from .scheduler import FairQueue
+
+logger = logging.getLogger("discord-aggregator")
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "reject")
+
+
+@dataclass
+class PublishJob:
+    content: str
+    source_key: str | None = None
+    guild_id: int | None = None
+    message_id: int | None = None
+    # attachment metadata (id, filename, url, size, content_type), the files are streamed from the CDN when publishing
+    attachments: list[dict] = field(default_factory=list)
+    embeds: list[dict] = field(default_factory=list)  # `discord.Embed.to_dict()`
+
+    @classmethod
+    def from_message(
+        cls,
+        message,
+        source_key: str | None = None,
+        *,
+        attachments: bool = True,
+        embeds: bool = True,
+    ) -> "PublishJob":
+        return cls(
+            message.content,
+            source_key,
+            message.guild.id if message.guild else None,
+            message.id,
+            attachments=[
+                {
+                    "id": attachment.id,
+                    "filename": attachment.filename,
+                    "url": attachment.url,
+                    "size": attachment.size,
+                    "content_type": attachment.content_type,
+                }
+                for attachment in message.attachments
+            ]
+            if attachments
+            else [],
+            embeds=[embed.to_dict() for embed in message.embeds] if embeds else [],
+        )
+
+    @property
+    def idempotency_key(self) -> str | None:
+        """Stable key derived from the Discord message, so the endpoint can drop replays and retries."""
+        return f"discord-message-{self.message_id}" if self.message_id else None
+
+    def to_payload(self) -> dict:
+        payload = {"content": self.content}
+        if self.source_key:
+            payload["source_key"] = self.source_key
+        if self.idempotency_key:
+            payload["idempotency_key"] = self.idempotency_key
+        if self.embeds:
+            payload["embeds"] = self.embeds
+        return payload
+
+    def size(self) -> int:
+        """Approximate encoded size, used to bound batches without serializing twice."""
+        size = len(self.content.encode()) + len(self.source_key or "")
+        if self.embeds:
+            size += len(json.dumps(self.embeds))
+        return size
+
+    def dumps(self) -> str:
+        return json.dumps(dataclasses.asdict(self))
+
+    @classmethod
+    def loads(cls, data: str) -> "PublishJob":
+        return cls(**json.loads(data))
+
+
+async def publish_jobs(
+    publisher,
+    jobs: list[PublishJob],
+    *,
+    batch_max_items: int = 1,
+    destinations: Callable[[PublishJob], list] | None = None,
+) -> list[bool]:
+    """Publish jobs in concurrent batches of up to `batch_max_items`, returns whether each job was accepted.
+
+    `destinations` maps a job to the `Destination`s it fans out to, `None` or an empty list is the default endpoint.
+    Every destination is published to concurrently and a job only counts as accepted if all of them accepted it.
+    """
+    # destination -> indexes of the jobs routed to it
+    routes: dict[object, list[int]] = {}
+    for index, job in enumerate(jobs):
+        for destination in (destinations(job) if destinations else None) or [None]:
+            routes.setdefault(destination, []).append(index)
+
+    sent = await asyncio.gather(
+        *(
+            _publish_to(publisher, [jobs[index] for index in indexes], batch_max_items, destination)
+            for destination, indexes in routes.items()
+        ),
+    )
+
+    results = [True] * len(jobs)
+    for indexes, route_results in zip(routes.values(), sent, strict=True):
+        for index, published in zip(indexes, route_results, strict=True):
+            results[index] = results[index] and published
+    return results
+
+
+async def _publish_to(publisher, jobs: list[PublishJob], batch_max_items: int, destination) -> list[bool]:
+    # jobs with attachments are streamed as multipart uploads, so they are always sent on their own
+    chunks = [[index] for index, job in enumerate(jobs) if batch_max_items <= 1 or job.attachments]
+    batchable = [index for index, job in enumerate(jobs) if batch_max_items > 1 and not job.attachments]
+    chunks.extend(batchable[i : i + batch_max_items] for i in range(0, len(batchable), batch_max_items))
+
+    sent = await asyncio.gather(
+        *(_publish_chunk(publisher, [jobs[index] for index in chunk], destination) for chunk in chunks),
+    )
+
+    results = [False] * len(jobs)
+    for chunk, chunk_results in zip(chunks, sent, strict=True):
+        for index, published in zip(chunk, chunk_results, strict=True):
+            results[index] = published
+    return results
+
+
+async def _publish_chunk(publisher, jobs: list[PublishJob], destination) -> list[bool]:
+    if len(jobs) == 1:
+        return [await publisher.publish(jobs[0].to_payload(), destination, jobs[0].attachments)]
+    return await publisher.publish_batch([job.to_payload() for job in jobs], destination)
+
+
+class PublishQueue:
+    """Bounded queue of publish jobs drained by a pool of worker tasks, so listeners only have to enqueue.
+
+    Jobs are queued per guild and served fairly, see `FairQueue`. Workers pass jobs to `handler` one at a time,
+    or in batches of up to `batch_max_items`. Jobs that are never handled (dropped on overflow, abandoned by
+    `close` or in a batch the handler raised on) are passed to `on_drop`.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        handler: Callable[[list[PublishJob]], Awaitable[object]],
+        *,
+        on_drop: Callable[[list[PublishJob]], object] | None = None,
+        maxsize: int = 1000,
+        workers: int = 4,
+        overflow: str = "block",
+        batch_max_items: int = 1,
+        batch_max_bytes: int = 256_000,
+        batch_linger: float = 0.05,
+        weights: dict[int, int] | None = None,
+        max_in_flight: dict[int, int] | None = None,
+        default_weight: int = 1,
+        default_max_in_flight: int = 0,
+    ):
+        if overflow not in OVERFLOW_POLICIES:
+            msg = f"Invalid overflow policy {overflow}, was expecting one of {', '.join(OVERFLOW_POLICIES)}"
+            raise ValueError(msg)
+
+        self.handler = handler
+        self.on_drop = on_drop
+        self.workers = workers
+        self.overflow = overflow
+
+        self.batch_max_items = batch_max_items
+        self.batch_max_bytes = batch_max_bytes
+        self.batch_linger = batch_linger
+
+        self._queue = FairQueue(
+            maxsize,
+            weights=weights,
+            max_in_flight=max_in_flight,
+            default_weight=default_weight,
+            default_max_in_flight=default_max_in_flight,
+        )
+        self._tasks: list[asyncio.Task] = []
+        self._closing = False
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def guild_sizes(self) -> dict[int, int]:
+        return self._queue.guild_sizes()
+
+    async def start(self):
+        self._closing = False
+        self._tasks = [asyncio.create_task(self._worker(), name=f"publish-worker-{i}") for i in range(self.workers)]
+
+    async def put(self, job: PublishJob) -> bool:
+        """Enqueue a job following the overflow policy, returns whether it was accepted."""
+        if self._closing:
+            logger.warning("Publish queue is closing, rejected job.")
+            return False
+
+        if self.overflow == "block":
+            await self._queue.put(job)
+            return True
+
+        if self._queue.full():
+            if self.overflow == "reject":
+                logger.warning("Publish queue is full (%d), rejected job.", self._queue.maxsize)
+                return False
+
+            # drop_oldest, taken from the guild with the most queued jobs
+            dropped = self._queue.drop_oldest()
+            if dropped:
+                logger.warning("Publish queue is full (%d), dropped oldest job.", self._queue.maxsize)
+                self._drop([dropped])
+
+        self._queue.put_nowait(job)
+        return True
+
+    async def close(self, timeout: float | None = None):  # noqa: ASYNC109
+        """Stop accepting jobs, wait up to `timeout` for queued jobs to drain, then stop the workers."""
+        self._closing = True
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except TimeoutError:
+            abandoned = self._queue.clear()
+            logger.warning("Publish queue did not drain in time, abandoning %d jobs.", len(abandoned))
+            self._drop(abandoned)
+
+        # jobs still being handled are abandoned by their worker
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while True:
+            jobs = await self._next_batch() if self.batch_max_items > 1 else [await self._queue.get()]
+            try:
+                await self.handler(jobs)
+            except asyncio.CancelledError:
+                self._drop(jobs)
+                raise
+            except Exception:
+                logger.exception("Unexpected error while handling %d publish jobs.", len(jobs))
+                self._drop(jobs)
+            finally:
+                for job in jobs:
+                    self._queue.task_done(job)
+
+    def _drop(self, jobs: list[PublishJob]):
+        if self.on_drop and jobs:
+            self.on_drop(jobs)
+
+    async def _next_batch(self) -> list[PublishJob]:
+        """Wait for a job, then keep gathering until the batch is full or has lingered long enough."""
+        job = await self._queue.get()
+        jobs = [job]
+        size = job.size()
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.batch_linger
+        while len(jobs) < self.batch_max_items and size < self.batch_max_bytes:
+            try:
+                job = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    job = await asyncio.wait_for(self._queue.get(), remaining)
+                except TimeoutError:
+                    break
+
+            jobs.append(job)
+            size += job.size()
+        return jobs
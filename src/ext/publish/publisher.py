@@ -0,0 +1,391 @@
+import asyncio
+import http
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass
+
+import aiohttp
+
+import metrics
+
+from .encoding import compress
+from .encoding import get_encoder
+from .encoding import resolve_compression
+from .ratelimit import CircuitBreaker
+from .ratelimit import TokenBucket
+from .ratelimit import parse_retry_after
+
+logger = logging.getLogger("discord-aggregator")
+
+PUBLISH_REQUEST_SECONDS = metrics.histogram(
+    "bot_publish_request_seconds",
+    "Publish endpoint request latency, by status code.",
+    ("status",),
+)
+
+
+@dataclass(frozen=True)
+class Destination:
+    """A publish endpoint with its own credentials, used instead of the default endpoint for some guilds."""
+
+    name: str
+    url: str
+    api_key: str | None = None
+
+
+def group_destinations(rows) -> dict[int, list[Destination]]:
+    """`GuildPublishDestination` rows as guild_id -> destinations."""
+    destinations: dict[int, list[Destination]] = {}
+    for row in rows:
+        destinations.setdefault(row.guild_id, []).append(Destination(row.name, row.url, row.api_key))
+    return destinations
+
+
+class AttachmentError(Exception):
+    """An attachment couldn't be streamed from Discord's CDN, e.g. it was larger than advertised."""
+
+
+class Publisher:
+    """Long-lived HTTP client for the publish endpoint, keeps a keep-alive connection pool between publishes.
+
+    Publishes go to the default `url` unless a `Destination` is given, every endpoint shares the connection pool
+    but gets its own rate limiter and circuit breaker so a slow or failing endpoint doesn't hold back the others.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        url: str,
+        api_key: str | None,
+        *,
+        pool_limit: int = 100,
+        pool_limit_per_host: int = 20,
+        keepalive_timeout: float = 30.0,
+        dns_cache_ttl: int = 300,
+        timeout: float = 10.0,
+        connect_timeout: float = 5.0,
+        rate_limit: float = 0.0,
+        rate_limit_burst: int = 1,
+        breaker: CircuitBreaker | None = None,
+        encoder: str = "auto",
+        compression: str = "none",
+        compression_threshold: int = 1024,
+        log_content_limit: int = 200,
+        log_sample_rate: float = 1.0,
+        attachment_max_size: int = 25 * 1024 * 1024,
+        attachment_concurrency: int = 4,
+        attachment_chunk_size: int = 64 * 1024,
+    ):
+        self.url = url
+        self.api_key = api_key
+
+        self.pool_limit = pool_limit
+        self.pool_limit_per_host = pool_limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+
+        self.limiter = TokenBucket(rate_limit, rate_limit_burst)
+        self.breaker = breaker or CircuitBreaker()
+
+        self.encode = get_encoder(encoder)
+        self.compression = resolve_compression(compression)
+        self.compression_threshold = compression_threshold
+        # endpoints that answered a compressed body with 415, they get uncompressed bodies from then on
+        self._uncompressed_urls: set[str] = set()
+
+        # per-message logs only, failures are always logged
+        self.log_content_limit = log_content_limit
+        self.log_sample_rate = log_sample_rate
+
+        # attachments are streamed from the CDN into the upload chunk by chunk, never buffered whole
+        self.attachment_max_size = attachment_max_size
+        self.attachment_chunk_size = attachment_chunk_size
+        self._attachment_slots = asyncio.Semaphore(attachment_concurrency)
+
+        self._session: aiohttp.ClientSession | None = None
+        # url -> (limiter, breaker), the default endpoint uses `limiter` and `breaker`
+        self._guards: dict[str, tuple[TokenBucket, CircuitBreaker]] = {url: (self.limiter, self.breaker)}
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(
+            settings.publish_url,
+            getattr(settings, "publish_api_key", None),
+            pool_limit=settings.publish_pool_limit,
+            pool_limit_per_host=settings.publish_pool_limit_per_host,
+            keepalive_timeout=settings.publish_keepalive_timeout,
+            dns_cache_ttl=settings.publish_dns_cache_ttl,
+            timeout=settings.publish_timeout,
+            connect_timeout=settings.publish_connect_timeout,
+            rate_limit=settings.rate_limit,
+            rate_limit_burst=settings.rate_limit_burst,
+            breaker=CircuitBreaker(
+                failure_threshold=settings.breaker_failure_threshold,
+                reset_timeout=settings.breaker_reset_timeout,
+                half_open_max=settings.breaker_half_open_max,
+            ),
+            encoder=settings.publish_encoder,
+            compression=settings.publish_compression,
+            compression_threshold=settings.publish_compression_threshold,
+            log_content_limit=settings.log_content_limit,
+            log_sample_rate=settings.log_sample_rate,
+            attachment_max_size=settings.attachment_max_size,
+            attachment_concurrency=settings.attachment_concurrency,
+        )
+
+    async def start(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_limit,
+            limit_per_host=self.pool_limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_cache_ttl,
+        )
+        # credentials are sent per request, they differ between destinations
+        self._session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout, sock_connect=self.connect_timeout),
+        )
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    def endpoints(self) -> dict[str, tuple[TokenBucket, CircuitBreaker]]:
+        """Rate limiter and circuit breaker of every endpoint published to so far, the default endpoint first."""
+        return dict(self._guards)
+
+    def _guard(self, url: str) -> tuple[TokenBucket, CircuitBreaker]:
+        guard = self._guards.get(url)
+        if guard is None:
+            guard = self._guards[url] = (
+                TokenBucket(self.limiter.max_rate, self.limiter.burst),
+                CircuitBreaker(self.breaker.failure_threshold, self.breaker.reset_timeout, self.breaker.half_open_max),
+            )
+        return guard
+
+    def _log_content(self, content: str) -> str:
+        if len(content) <= self.log_content_limit:
+            return content
+        return f"{content[: self.log_content_limit]}... ({len(content)} characters)"
+
+    async def publish(
+        self,
+        payload: dict,
+        destination: Destination | None = None,
+        attachments: list[dict] | None = None,
+    ) -> bool:
+        """Publish a single message payload, returns whether the endpoint accepted it.
+
+        With `attachments` the payload is sent as a multipart upload, see `_send_multipart`.
+        """
+        sampled = self.log_sample_rate >= 1 or random.random() < self.log_sample_rate  # noqa: S311
+        if sampled:
+            logger.info(
+                "Publishing to %s with content: %s for %s",
+                destination.url if destination else self.url,
+                self._log_content(payload["content"]),
+                payload.get("source_key") or "no source key",
+            )
+
+        headers = {"Idempotency-Key": payload["idempotency_key"]} if "idempotency_key" in payload else None
+        status, text = await self._post(payload, destination, headers, attachments)
+        if status == http.HTTPStatus.OK:
+            if sampled:
+                logger.info("Successfully published content.")
+            return True
+
+        logger.warning("Failed to publish: %s %s", status, text)
+        return False
+
+    async def publish_batch(self, payloads: list[dict], destination: Destination | None = None) -> list[bool]:
+        """Publish many message payloads as one JSON array, returns whether each item was accepted."""
+        logger.info("Publishing batch of %d to %s", len(payloads), destination.url if destination else self.url)
+
+        status, text = await self._post(payloads, destination)
+        if status != http.HTTPStatus.OK:
+            logger.warning("Failed to publish batch: %s %s", status, text)
+            return [False] * len(payloads)
+
+        try:
+            results = _parse_batch_results(json.loads(text) if text.strip() else None, len(payloads))
+        except ValueError as e:
+            logger.warning("Failed to publish batch: %r", e)
+            return [False] * len(payloads)
+
+        failed = results.count(False)
+        if failed:
+            logger.warning("Failed to publish %d of %d batched items.", failed, len(payloads))
+        else:
+            logger.info("Successfully published batch.")
+        return results
+
+    async def _post(
+        self,
+        body,
+        destination: Destination | None = None,
+        headers: dict | None = None,
+        attachments: list[dict] | None = None,
+    ) -> tuple[int | None, str]:
+        """POST through the endpoint's breaker and rate limiter, returns the status (None if not sent) and body."""
+        url, api_key = (destination.url, destination.api_key) if destination else (self.url, self.api_key)
+        headers = dict(headers or {})
+        if api_key:
+            headers["x-api-key"] = api_key
+        limiter, breaker = self._guard(url)
+        probe = breaker.state == breaker.HALF_OPEN
+        if not breaker.allow():
+            return None, f"circuit open, retrying in {breaker.retry_in():.1f}s"
+
+        verdict = False
+        try:
+            await limiter.acquire()
+            start = time.perf_counter()
+            try:
+                if attachments:
+                    status, text, retry_after = await self._send_multipart(url, body, attachments, headers)
+                else:
+                    status, text, retry_after = await self._send_json(url, body, headers)
+            except (aiohttp.ClientError, TimeoutError) as e:
+                PUBLISH_REQUEST_SECONDS.observe(time.perf_counter() - start, status="error")
+                if isinstance(e.__cause__, AttachmentError):
+                    # the CDN download failed, not the publish endpoint
+                    return None, repr(e.__cause__)
+                breaker.record_failure()
+                verdict = True
+                return None, repr(e)
+            PUBLISH_REQUEST_SECONDS.observe(time.perf_counter() - start, status=status)
+
+            if status == http.HTTPStatus.TOO_MANY_REQUESTS or status >= http.HTTPStatus.INTERNAL_SERVER_ERROR:
+                limiter.penalize()
+                if retry_after:
+                    limiter.pause(retry_after)
+                breaker.record_failure(retry_after)
+            else:
+                # any other response means the endpoint is healthy, even if it rejected this payload
+                limiter.reward()
+                breaker.record_success()
+            verdict = True
+            return status, text
+        finally:
+            if probe and not verdict:
+                # a failed attachment or a cancellation says nothing about the endpoint, let another probe through
+                breaker.release_probe()
+
+    async def _send_json(self, url: str, body, headers: dict) -> tuple[int, str, float | None]:
+        data = self.encode(body)
+        compressed = len(data) >= self.compression_threshold and url not in self._uncompressed_urls
+        compression = self.compression if compressed else "none"
+
+        status, text, retry_after = await self._send(url, data, compression, headers)
+        if status == http.HTTPStatus.UNSUPPORTED_MEDIA_TYPE and compression != "none":
+            # the endpoint doesn't accept this encoding, stop compressing for it and resend as is
+            logger.warning("%s rejected %s request bodies, disabling compression for it.", url, compression)
+            self._uncompressed_urls.add(url)
+            status, text, retry_after = await self._send(url, data, "none", headers)
+        return status, text, retry_after
+
+    async def _send_multipart(
+        self,
+        url: str,
+        payload: dict,
+        attachments: list[dict],
+        headers: dict,
+    ) -> tuple[int, str, float | None]:
+        """POST the payload as a `payload` JSON part followed by one `files` part per attachment.
+
+        Files are streamed from the CDN while the request body is written, so memory use doesn't depend on their size.
+        Attachments over `attachment_max_size` are only described in the payload's `attachments` field.
+        """
+        files = [attachment for attachment in attachments if attachment["size"] <= self.attachment_max_size]
+        described = [
+            attachment if attachment in files else {**attachment, "skipped": "too_large"} for attachment in attachments
+        ]
+        body = self.encode({**payload, "attachments": described})
+
+        with aiohttp.MultipartWriter("form-data") as writer:
+            part = writer.append_payload(aiohttp.BytesPayload(body, content_type="application/json"))
+            part.set_content_disposition("form-data", name="payload")
+            for attachment in files:
+                part = writer.append(
+                    self._stream_attachment(attachment),
+                    {"Content-Type": attachment["content_type"] or "application/octet-stream"},
+                )
+                part.set_content_disposition("form-data", name="files", filename=attachment["filename"])
+
+            # uploads can take longer than `timeout`, only bound the time between chunks
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout, sock_read=self.timeout)
+            async with (
+                self._attachment_slots,
+                self._session.post(url, data=writer, headers=headers, timeout=timeout) as response,
+            ):
+                return (
+                    response.status,
+                    await response.text(),
+                    parse_retry_after(response.headers.get("Retry-After")),
+                )
+
+    async def _stream_attachment(self, attachment: dict):
+        timeout = aiohttp.ClientTimeout(total=None, sock_connect=self.connect_timeout, sock_read=self.timeout)
+        async with self._session.get(attachment["url"], timeout=timeout) as response:
+            if response.status != http.HTTPStatus.OK:
+                msg = f"Failed to download attachment {attachment['id']}: {response.status}"
+                raise AttachmentError(msg)
+
+            received = 0
+            async for chunk in response.content.iter_chunked(self.attachment_chunk_size):
+                received += len(chunk)
+                if received > self.attachment_max_size:
+                    msg = f"Attachment {attachment['id']} is larger than {self.attachment_max_size} bytes"
+                    raise AttachmentError(msg)
+                yield chunk
+
+    async def _send(
+        self,
+        url: str,
+        data: bytes,
+        compression: str,
+        extra_headers: dict,
+    ) -> tuple[int, str, float | None]:
+        headers = {"Content-Type": "application/json", **extra_headers}
+        if compression != "none":
+            headers["Content-Encoding"] = compression
+            data = compress(data, compression)
+
+        async with self._session.post(url, data=data, headers=headers) as response:
+            return (
+                response.status,
+                await response.text(),
+                parse_retry_after(response.headers.get("Retry-After")),
+            )
+
+
+def _parse_batch_results(body, expected: int) -> list[bool]:
+    """Read per-item results from a batch response, either a list or `{"results": [...]}` in request order.
+
+    Each item is a bool, an HTTP status code, or an object with an `ok` or `status` field.
+    A response without per-item results means the whole batch was accepted.
+    """
+    if isinstance(body, dict):
+        body = body.get("results")
+    if not isinstance(body, list):
+        return [True] * expected
+    if len(body) != expected:
+        msg = f"Batch response has {len(body)} results, was expecting {expected}"
+        raise ValueError(msg)
+
+    results = []
+    for item in body:
+        if isinstance(item, dict):
+            item = item.get("ok", item.get("status"))  # noqa: PLW2901
+        if isinstance(item, bool):
+            results.append(item)
+        elif isinstance(item, int):
+            results.append(http.HTTPStatus.OK <= item < http.HTTPStatus.MULTIPLE_CHOICES)
+        else:
+            results.append(False)
+    return results
@@ -0,0 +1,139 @@
+import asyncio
+import time
+from datetime import UTC
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """Parse a `Retry-After` header, either delay seconds or an HTTP date, into seconds from now."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (retry_at - datetime.now(UTC)).total_seconds())
+
+
+class TokenBucket:
+    """Token bucket limiter whose rate backs off multiplicatively when the endpoint pushes back.
+
+    The rate is halved (down to `min_rate`) on every penalty and recovers additively on every reward,
+    a `pause` blocks all callers until a `Retry-After` has passed, even when the rate limit itself is disabled.
+    """
+
+    def __init__(self, rate: float, burst: int, min_rate: float = 1.0):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min(min_rate, rate)
+        self.burst = burst
+
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_rate > 0
+
+    async def acquire(self):
+        if not self.enabled and time.monotonic() >= self._paused_until:
+            return
+
+        # the lock keeps waiters in order so a burst of callers can't all see the same refill
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                if not self.enabled:
+                    return
+
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def penalize(self):
+        self.rate = max(self.min_rate, self.rate / 2)
+
+    def reward(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class CircuitBreaker:
+    """Circuit breaker that opens after `failure_threshold` consecutive failures.
+
+    Once `reset_timeout` (or a longer `Retry-After`) has passed it half-opens and lets `half_open_max`
+    probe requests through, a successful probe closes it again and a failed one re-opens it.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max = half_open_max
+
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.open_for = reset_timeout
+        self.total_opens = 0
+        self._probes = 0
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at < self.open_for:
+            return self.OPEN
+        return self.HALF_OPEN
+
+    def retry_in(self) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return max(0.0, self.opened_at + self.open_for - time.monotonic())
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.OPEN or self._probes >= self.half_open_max:
+            return False
+        self._probes += 1
+        return True
+
+    def release_probe(self):
+        """Give back a probe slot taken by `allow` for a request that ended without a verdict on the endpoint."""
+        self._probes = max(0, self._probes - 1)
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probes = 0
+
+    def record_failure(self, retry_after: float | None = None):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self._open(max(self.reset_timeout, retry_after or 0.0))
+
+    def _open(self, seconds: float):
+        if self.opened_at is None:
+            self.total_opens += 1
+        self.opened_at = time.monotonic()
+        self.open_for = seconds
+        self._probes = 0
@@ -0,0 +1,174 @@
+import asyncio
+import contextlib
+import operator
+from collections import deque
+from collections.abc import Callable
+from collections.abc import Hashable
+
+
+class FairQueue:
+    """Per-guild FIFO queues of publish jobs served by deficit round robin, so a busy guild can't starve the others.
+
+    Every turn a guild may take up to its weight in jobs before the next guild is served, guilds with `max_in_flight`
+    unfinished jobs are skipped until `task_done` is called for one of them. `maxsize` bounds all guilds together.
+    `weights` and `max_in_flight` are read on every turn, so updating them applies immediately.
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        maxsize: int = 0,
+        *,
+        key: Callable[[object], Hashable] = operator.attrgetter("guild_id"),
+        weights: dict[Hashable, int] | None = None,
+        max_in_flight: dict[Hashable, int] | None = None,
+        default_weight: int = 1,
+        default_max_in_flight: int = 0,
+    ):
+        self.maxsize = maxsize
+        self.key = key
+        self.weights = weights if weights is not None else {}
+        self.max_in_flight = max_in_flight if max_in_flight is not None else {}
+        self.default_weight = default_weight
+        self.default_max_in_flight = default_max_in_flight  # 0 is unlimited
+
+        self._queues: dict[Hashable, deque] = {}
+        self._active: deque[Hashable] = deque()  # guilds with queued jobs, in serving order
+        self._deficit: dict[Hashable, int] = {}
+        self._in_flight: dict[Hashable, int] = {}
+        self._size = 0
+        self._unfinished = 0
+
+        self._getters: list[asyncio.Future] = []
+        self._putters: list[asyncio.Future] = []
+        self._joiners: list[asyncio.Future] = []
+
+    def qsize(self) -> int:
+        return self._size
+
+    def guild_sizes(self) -> dict[Hashable, int]:
+        return {key: len(queue) for key, queue in self._queues.items()}
+
+    def full(self) -> bool:
+        return 0 < self.maxsize <= self._size
+
+    async def put(self, job):
+        while self.full():
+            await self._wait(self._putters)
+        self.put_nowait(job)
+
+    def put_nowait(self, job):
+        if self.full():
+            raise asyncio.QueueFull
+
+        key = self.key(job)
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            self._active.append(key)
+        queue.append(job)
+        self._size += 1
+        self._unfinished += 1
+        self._wake(self._getters)
+
+    async def get(self):
+        while (job := self._pop()) is None:
+            await self._wait(self._getters)
+        return job
+
+    def get_nowait(self):
+        job = self._pop()
+        if job is None:
+            raise asyncio.QueueEmpty
+        return job
+
+    def drop_oldest(self):
+        """Drop the oldest job of the guild with the most queued jobs, returns it."""
+        if not self._queues:
+            return None
+
+        key = max(self._queues, key=lambda key: len(self._queues[key]))
+        job = self._queues[key].popleft()
+        if not self._queues[key]:
+            self._remove(key)
+        self._size -= 1
+        self._unfinished -= 1
+        self._wake(self._putters)
+        if not self._unfinished:
+            self._wake(self._joiners)
+        return job
+
+    def task_done(self, job):
+        """Mark a job returned by `get` as handled, freeing a slot of its guild's in-flight cap."""
+        key = self.key(job)
+        self._in_flight[key] -= 1
+        if not self._in_flight[key]:
+            del self._in_flight[key]
+        self._unfinished -= 1
+        self._wake(self._getters)
+        if not self._unfinished:
+            self._wake(self._joiners)
+
+    def clear(self) -> list:
+        """Remove and return every queued job, jobs already returned by `get` still need `task_done`."""
+        jobs = [job for queue in self._queues.values() for job in queue]
+        self._queues.clear()
+        self._active.clear()
+        self._deficit.clear()
+        self._size = 0
+        self._unfinished -= len(jobs)
+        self._wake(self._putters)
+        if not self._unfinished:
+            self._wake(self._joiners)
+        return jobs
+
+    async def join(self):
+        while self._unfinished:
+            await self._wait(self._joiners)
+
+    def _capped(self, key: Hashable) -> bool:
+        cap = self.max_in_flight.get(key, self.default_max_in_flight)
+        return 0 < cap <= self._in_flight.get(key, 0)
+
+    def _pop(self):
+        for _ in range(len(self._active)):
+            key = self._active[0]
+            if self._capped(key):
+                self._active.rotate(-1)
+                continue
+
+            if self._deficit.get(key, 0) <= 0:
+                self._deficit[key] = max(1, self.weights.get(key, self.default_weight))
+            self._deficit[key] -= 1
+
+            job = self._queues[key].popleft()
+            if not self._queues[key]:
+                self._remove(key)
+            elif self._deficit[key] <= 0:
+                # used up its turn, move on to the next guild
+                self._active.rotate(-1)
+
+            self._size -= 1
+            self._in_flight[key] = self._in_flight.get(key, 0) + 1
+            self._wake(self._putters)
+            return job
+        return None
+
+    def _remove(self, key: Hashable):
+        del self._queues[key]
+        self._active.remove(key)
+        self._deficit.pop(key, None)
+
+    async def _wait(self, waiters: list[asyncio.Future]):
+        waiter = asyncio.get_running_loop().create_future()
+        waiters.append(waiter)
+        try:
+            await waiter
+        finally:
+            with contextlib.suppress(ValueError):
+                waiters.remove(waiter)
+
+    def _wake(self, waiters: list[asyncio.Future]):
+        # woken waiters re-check their condition and wait again if another waiter got there first
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+
+from database import ensure_tables
+
+from .extension import load_destinations
+from .extension import send_jobs
+from .outbox import OutboxDispatcher
+from .pipeline import PublishJob
+from .publisher import Destination
+from .publisher import Publisher
+
+logger = logging.getLogger("discord-aggregator")
+
+
+class PublishWorker:
+    """Publishes outbox entries stored by bot processes in "gateway" mode, without a Discord connection.
+
+    Entries are claimed with a lease, so any number of workers can share the database. Destinations are reloaded
+    every `routing_refresh_interval` seconds to pick up `manage-destinations` changes made through the bot.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.destinations: dict[int, list[Destination]] = {}
+        self.publisher: Publisher | None = None
+        self.outbox: OutboxDispatcher | None = None
+        self._refresh_task: asyncio.Task | None = None
+
+    async def start(self):
+        await ensure_tables()
+        self.destinations = await load_destinations()
+
+        self.publisher = Publisher.from_settings(self.settings)
+        await self.publisher.start()
+
+        self.outbox = OutboxDispatcher.from_settings(self._send_jobs, self.settings)
+        await self.outbox.start()
+        self._refresh_task = asyncio.create_task(self._refresh_destinations(), name="publish-destinations-refresh")
+
+    async def close(self):
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+        # the current batch is finished while the publisher is still open
+        if self.outbox:
+            await self.outbox.close(self.settings.queue_drain_timeout)
+        if self.publisher:
+            await self.publisher.close()
+
+    async def _send_jobs(self, jobs: list[PublishJob]) -> list[bool]:
+        return await send_jobs(self.publisher, jobs, self.destinations, self.settings)
+
+    async def _refresh_destinations(self):
+        while True:
+            await asyncio.sleep(self.settings.routing_refresh_interval)
+            try:
+                self.destinations = await load_destinations()
+            except Exception:
+                logger.exception("Failed to reload publish destinations, keeping the previous ones.")
@@ -1,5 +1,9 @@
+import discord
+
 from .extension import Utils
 
+INTENTS = discord.Intents(guilds=True)
+
 
 async def setup(bot):
     await bot.add_cog(Utils(bot))
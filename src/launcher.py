@@ -0,0 +1,118 @@
+"""Run the bot as `SHARD_PROCESSES` processes that each own a contiguous range of shards.
+
+Every process runs `bot.py` with `SHARD_COUNT`/`SHARD_IDS` set, they share the same SQLite database (WAL mode and
+`busy_timeout` make concurrent access safe) and only the first one syncs the command tree.
+"""
+
+import os
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+import settings
+
+logger = settings.APP_LOGGER
+BOT_PATH = Path(__file__).parent / "bot.py"
+RESTART_DELAY = 5
+
+
+def fetch_recommended_shard_count() -> int:
+    response = requests.get(
+        "https://discord.com/api/v10/gateway/bot",
+        headers={"Authorization": f"Bot {settings.BOT_TOKEN}"},
+        timeout=10,
+    )
+    response.raise_for_status()
+    return response.json()["shards"]
+
+
+def split_shards(shard_count: int, processes: int) -> list[list[int]]:
+    """Split shard IDs into `processes` contiguous ranges, sizes differ by at most one."""
+    size, extra = divmod(shard_count, processes)
+    ranges = []
+    start = 0
+    for index in range(processes):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(list(range(start, end)))
+        start = end
+    return ranges
+
+
+class Launcher:
+    def __init__(self, shard_count: int, processes: int):
+        self.shard_count = shard_count
+        self.shard_ranges = split_shards(shard_count, processes)
+        self.workers: dict[int, subprocess.Popen] = {}
+        self.stopping = False
+
+    def spawn(self, index: int):
+        shard_ids = self.shard_ranges[index]
+        env = {
+            **os.environ,
+            "SHARDING": "true",
+            "SHARD_COUNT": str(self.shard_count),
+            "SHARD_IDS": ",".join(map(str, shard_ids)),
+            "SHARD_PRIMARY": "true" if index == 0 else "false",
+        }
+        if settings.METRICS_PORT:
+            # one metrics port per process
+            env["METRICS_PORT"] = str(settings.METRICS_PORT + index)
+        # new session so a terminal ctrl+c only reaches the launcher, which forwards it once
+        self.workers[index] = subprocess.Popen(  # noqa: S603
+            [sys.executable, str(BOT_PATH)],
+            env=env,
+            start_new_session=True,
+        )
+        logger.info("Started process %d (pid %d) for shards %s", index, self.workers[index].pid, shard_ids)
+
+    def stop(self, *args):
+        if self.stopping:
+            return
+        self.stopping = True
+        logger.info("Stopping %d shard processes...", len(self.workers))
+        for worker in self.workers.values():
+            if worker.poll() is None:
+                worker.send_signal(signal.SIGINT)
+
+    def run(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+
+        # stagger startup, identifying is rate limited and the first process creates/migrates the database
+        for index in range(len(self.shard_ranges)):
+            if self.stopping:
+                break
+            self.spawn(index)
+            time.sleep(settings.SHARD_STARTUP_DELAY)
+
+        while self.workers:
+            for index, worker in list(self.workers.items()):
+                code = worker.poll()
+                if code is None:
+                    continue
+
+                del self.workers[index]
+                if not self.stopping and code != 0:
+                    logger.warning("Shard process %d exited with %d, restarting...", index, code)
+                    time.sleep(RESTART_DELAY)
+                    self.spawn(index)
+            time.sleep(1)
+
+        logger.info("All shard processes stopped.")
+
+
+def main():
+    # every bot process needs the token, fail before spawning them
+    settings.require_bot_token()
+    shard_count = settings.SHARD_COUNT or fetch_recommended_shard_count()
+    processes = max(1, min(settings.SHARD_PROCESSES, shard_count))
+    logger.info("Launching %d shards across %d processes", shard_count, processes)
+    Launcher(shard_count, processes).run()
+
+
+if __name__ == "__main__":
+    main()
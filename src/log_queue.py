@@ -0,0 +1,89 @@
+"""Logging through a queue, so writing log lines never blocks the event loop.
+
+Loggers get a `QueueHandler` that only enqueues records, a single `QueueListener` thread formats them as text or
+JSON and writes them to stderr.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import queue
+
+LOG_FORMATS = ("text", "json")
+DT_FMT = "%Y-%m-%d %H:%M:%S"
+
+_queue: queue.SimpleQueue = queue.SimpleQueue()
+_listener: logging.handlers.QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with the record's time, level, logger, message and traceback."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record, DT_FMT),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        if record.stack_info:
+            entry["stack_info"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # merge the arguments now since they may change before the listener gets to the record,
+        # but keep the traceback separate so the JSON formatter can put it in its own field
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def create_formatter(log_format: str = "text") -> logging.Formatter:
+    if log_format not in LOG_FORMATS:
+        msg = f"Invalid log format {log_format}, was expecting one of {', '.join(LOG_FORMATS)}"
+        raise ValueError(msg)
+
+    if log_format == "json":
+        return JsonFormatter()
+    return logging.Formatter("[{asctime}] [{levelname}] {name}: {message}", DT_FMT, style="{")
+
+
+def start_listener(log_format: str = "text"):
+    """Start the listener thread if it isn't running yet, it is stopped (and flushed) at exit."""
+    global _listener  # noqa: PLW0603
+    if _listener:
+        return
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(create_formatter(log_format))
+    _listener = logging.handlers.QueueListener(_queue, handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_listener)
+
+
+def stop_listener():
+    global _listener  # noqa: PLW0603
+    if _listener:
+        _listener.stop()
+        _listener = None
+
+
+def attach_queue_handler(logger: logging.Logger, log_format: str = "text") -> logging.Logger:
+    """Replace the logger's handlers with one that hands records to the listener thread."""
+    start_listener(log_format)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(_QueueHandler(_queue))
+    return logger
@@ -0,0 +1,52 @@
+"""Publish outbox entries stored by bot processes running with `PUBLISH_MODE=gateway`.
+
+The worker never connects to Discord, it only shares the SQLite database with the bot. Run as many workers as the
+endpoint can take, e.g. one per core; each claims entries with a lease, so no entry is published twice while its
+lease holds. Settings come from `EXTENSION_SETTINGS["publish"]`, the same environment as the bot.
+"""
+
+import asyncio
+import signal
+
+import metrics
+import settings
+from configurable_cog import load_settings
+from database.setup import connect_to_db
+from database.setup import disconnect_from_db
+from ext.publish.extension import default_settings
+from ext.publish.worker import PublishWorker
+
+logger = settings.APP_LOGGER
+
+
+async def main():
+    publish_settings = load_settings("publish", default_settings, settings.EXTENSION_SETTINGS)
+    metrics_server = (
+        metrics.MetricsServer(settings.METRICS_HOST, settings.PUBLISHER_WORKER_METRICS_PORT)
+        if settings.PUBLISHER_WORKER_METRICS_PORT
+        else None
+    )
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+
+    await connect_to_db()
+    worker = PublishWorker(publish_settings)
+    try:
+        if metrics_server:
+            await metrics_server.start()
+        await worker.start()
+        logger.info("Publisher worker started, polling the outbox every %gs", publish_settings.outbox_poll_interval)
+        await stopping.wait()
+        logger.info("Stopping publisher worker...")
+    finally:
+        await worker.close()
+        await disconnect_from_db()
+        if metrics_server:
+            await metrics_server.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -4,23 +4,26 @@ from zoneinfo import ZoneInfo
 
 from dotenv import load_dotenv
 
+from log_queue import attach_queue_handler
+
+# loaded before logging is set up so `LOG_FORMAT` can come from .env
+load_dotenv()
+
+# "text" or "json", records are written by a background thread so logging never blocks the event loop
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")
+
 
 def setup_app_logging():
+    # cog loggers are children of "bloom" and only set their level, see `ConfigurableCog._setup_logger`
+    attach_queue_handler(logging.getLogger("bloom"), LOG_FORMAT)
+
     logger = logging.getLogger("discord-aggregator")
     logger.setLevel(logging.INFO)
-
-    handler = logging.StreamHandler()
-    dt_fmt = "%Y-%m-%d %H:%M:%S"
-    formatter = logging.Formatter("[{asctime}] [{levelname}] {name}: {message}", dt_fmt, style="{")
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
-    return logger
+    return attach_queue_handler(logger, LOG_FORMAT)
 
 
 APP_LOGGER = setup_app_logging()
 
-load_dotenv()
-
 # == App Settings == #
 DEV = os.getenv("DEV", "true").lower() == "true"
 if DEV:
@@ -33,11 +36,53 @@ VERSION = "1.0.garbage"
 # == Bot Settings == #
 BOT_PREFIXES = ["="]
 
-BOT_TOKEN = os.getenv("BOT_TOKEN")
-if not BOT_TOKEN:
-    msg = "No `BOT_TOKEN` environment variable provided!"
+# gateway intents and caches, "extensions" intents only enables what the loaded extensions declare in `INTENTS`
+RUNTIME_PROFILES = {
+    "full": {
+        "intents": "all",
+        "member_cache": "all",
+        "chunk_guilds_at_startup": True,
+        "max_messages": 1000,
+    },
+    "publisher-minimal": {
+        "intents": "extensions",
+        "member_cache": "none",
+        "chunk_guilds_at_startup": False,
+        "max_messages": None,
+    },
+}
+RUNTIME_PROFILE = os.getenv("RUNTIME_PROFILE", "full")
+if RUNTIME_PROFILE not in RUNTIME_PROFILES:
+    msg = f"Unknown `RUNTIME_PROFILE` {RUNTIME_PROFILE}, was expecting one of {', '.join(RUNTIME_PROFILES)}"
     raise KeyError(msg)
 
+# only checked by processes that connect to Discord, publisher workers run without a token
+BOT_TOKEN = os.getenv("BOT_TOKEN")
+
+
+def require_bot_token() -> str:
+    if not BOT_TOKEN:
+        msg = "No `BOT_TOKEN` environment variable provided!"
+        raise KeyError(msg)
+    return BOT_TOKEN
+
+# sharding, `SHARD_IDS` is a comma separated list of the shards this process owns (set by `launcher.py`)
+SHARD_COUNT = int(os.getenv("SHARD_COUNT")) if "SHARD_COUNT" in os.environ else None
+SHARD_IDS = [int(shard_id) for shard_id in os.getenv("SHARD_IDS").split(",")] if "SHARD_IDS" in os.environ else None
+SHARDING = os.getenv("SHARDING", "false").lower() == "true" or SHARD_COUNT is not None
+# only the primary process syncs the command tree when several processes share the bot
+SHARD_PRIMARY = os.getenv("SHARD_PRIMARY", "true").lower() == "true"
+SHARD_PROCESSES = int(os.getenv("SHARD_PROCESSES", "1"))
+SHARD_STARTUP_DELAY = float(os.getenv("SHARD_STARTUP_DELAY", "5"))
+
+# prometheus metrics on http://METRICS_HOST:METRICS_PORT/metrics, disabled without a port
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT")) if "METRICS_PORT" in os.environ else None
+# publisher workers (`publisher_worker.py`) serve their own metrics, several workers on one host need different ports
+PUBLISHER_WORKER_METRICS_PORT = (
+    int(os.getenv("PUBLISHER_WORKER_METRICS_PORT")) if "PUBLISHER_WORKER_METRICS_PORT" in os.environ else None
+)
+
 DISCORD_OWNER_ID = int(os.getenv("DISCORD_OWNER_ID")) if "DISCORD_OWNER_ID" in os.environ else None
 TESTING_GUILD_ID = int(os.getenv("TESTING_GUILD_ID")) if "TESTING_GUILD_ID" in os.environ else None
 TESTING_ADMIN_CHANNEL_ID = (
@@ -51,14 +96,73 @@ DATABASE_DRIVER = os.getenv("DATABASE_DRIVER", "aiosqlite")
 
 DATABASE_URL = f"{DATABASE_TYPE}+{DATABASE_DRIVER}://{DATABASE_PATH}"
 
+# engine profile, SQL echo is separate from `DEV` since it logs every statement
+DATABASE_ECHO = os.getenv("DATABASE_ECHO", "false").lower() == "true"
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "5"))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", "5"))
+DATABASE_POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", "30"))
+DATABASE_STATEMENT_CACHE_SIZE = int(os.getenv("DATABASE_STATEMENT_CACHE_SIZE", "256"))
+
+# applied to every new SQLite connection, WAL lets `on_message` readers run alongside admin command writers
+DATABASE_PRAGMAS = {
+    "journal_mode": os.getenv("DATABASE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("DATABASE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("DATABASE_BUSY_TIMEOUT", "5000")),  # milliseconds
+    "cache_size": int(os.getenv("DATABASE_CACHE_SIZE", "-65536")),  # negative is KiB, so 64 MiB
+    "mmap_size": int(os.getenv("DATABASE_MMAP_SIZE", "268435456")),  # bytes, so 256 MiB
+    "temp_store": os.getenv("DATABASE_TEMP_STORE", "MEMORY"),
+}
+
 # == Extensions == #
-ENABLED_EXTENSIONS = ["ext.utils", "ext.publish"]
+# diagnostics only adds owner commands and a low-overhead loop monitor, so it's enabled in production too
+ENABLED_EXTENSIONS = ["ext.utils", "ext.publish", "ext.diagnostics"]
 if DEV:
     ENABLED_EXTENSIONS.append("ext.development")
 
 EXTENSION_SETTINGS: dict = {
+    "diagnostics": {
+        "lag_interval": float(os.getenv("DIAGNOSTICS_LAG_INTERVAL", "0.05")),
+        "stall_threshold": float(os.getenv("DIAGNOSTICS_STALL_THRESHOLD", "0.25")),
+    },
     "publish": {
+        "publish_mode": os.getenv("PUBLISH_MODE", "inline"),
         "publish_url": os.getenv("PUBLISH_URL", "https://example.com/publish"),
         "publish_api_key": os.getenv("PUBLISH_API_KEY"),
+        "publish_pool_limit": int(os.getenv("PUBLISH_POOL_LIMIT", "100")),
+        "publish_pool_limit_per_host": int(os.getenv("PUBLISH_POOL_LIMIT_PER_HOST", "20")),
+        "publish_keepalive_timeout": float(os.getenv("PUBLISH_KEEPALIVE_TIMEOUT", "30")),
+        "publish_dns_cache_ttl": int(os.getenv("PUBLISH_DNS_CACHE_TTL", "300")),
+        "publish_timeout": float(os.getenv("PUBLISH_TIMEOUT", "10")),
+        "publish_connect_timeout": float(os.getenv("PUBLISH_CONNECT_TIMEOUT", "5")),
+        "publish_encoder": os.getenv("PUBLISH_ENCODER", "auto"),
+        "publish_compression": os.getenv("PUBLISH_COMPRESSION", "none"),
+        "publish_compression_threshold": int(os.getenv("PUBLISH_COMPRESSION_THRESHOLD", "1024")),
+        "queue_size": int(os.getenv("PUBLISH_QUEUE_SIZE", "1000")),
+        "queue_workers": int(os.getenv("PUBLISH_QUEUE_WORKERS", "4")),
+        "queue_overflow": os.getenv("PUBLISH_QUEUE_OVERFLOW", "block"),
+        "queue_drain_timeout": float(os.getenv("PUBLISH_QUEUE_DRAIN_TIMEOUT", "10")),
+        "queue_default_weight": int(os.getenv("PUBLISH_QUEUE_DEFAULT_WEIGHT", "1")),
+        "queue_default_max_in_flight": int(os.getenv("PUBLISH_QUEUE_DEFAULT_MAX_IN_FLIGHT", "0")),
+        "batch_enabled": os.getenv("PUBLISH_BATCH_ENABLED", "false").lower() == "true",
+        "batch_max_items": int(os.getenv("PUBLISH_BATCH_MAX_ITEMS", "50")),
+        "batch_max_bytes": int(os.getenv("PUBLISH_BATCH_MAX_BYTES", "256000")),
+        "batch_linger": float(os.getenv("PUBLISH_BATCH_LINGER", "0.05")),
+        "outbox_enabled": os.getenv("PUBLISH_OUTBOX_ENABLED", "false").lower() == "true",
+        "outbox_max_attempts": int(os.getenv("PUBLISH_OUTBOX_MAX_ATTEMPTS", "8")),
+        "outbox_claim_batch": int(os.getenv("PUBLISH_OUTBOX_CLAIM_BATCH", "100")),
+        "outbox_poll_interval": float(os.getenv("PUBLISH_OUTBOX_POLL_INTERVAL", "1")),
+        "outbox_lease": float(os.getenv("PUBLISH_OUTBOX_LEASE", "60")),
+        "rate_limit": float(os.getenv("PUBLISH_RATE_LIMIT", "0")),
+        "rate_limit_burst": int(os.getenv("PUBLISH_RATE_LIMIT_BURST", "20")),
+        "breaker_failure_threshold": int(os.getenv("PUBLISH_BREAKER_FAILURE_THRESHOLD", "5")),
+        "breaker_reset_timeout": float(os.getenv("PUBLISH_BREAKER_RESET_TIMEOUT", "30")),
+        "routing_refresh_interval": float(os.getenv("PUBLISH_ROUTING_REFRESH_INTERVAL", "30")),
+        "dedup_window": int(os.getenv("PUBLISH_DEDUP_WINDOW", "50000")),
+        "log_content_limit": int(os.getenv("PUBLISH_LOG_CONTENT_LIMIT", "200")),
+        "log_sample_rate": float(os.getenv("PUBLISH_LOG_SAMPLE_RATE", "1")),
+        "forward_attachments": os.getenv("PUBLISH_FORWARD_ATTACHMENTS", "false").lower() == "true",
+        "forward_embeds": os.getenv("PUBLISH_FORWARD_EMBEDS", "true").lower() == "true",
+        "attachment_max_size": int(os.getenv("PUBLISH_ATTACHMENT_MAX_SIZE", str(25 * 1024 * 1024))),
+        "attachment_concurrency": int(os.getenv("PUBLISH_ATTACHMENT_CONCURRENCY", "4")),
     },
 }
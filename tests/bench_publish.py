@@ -0,0 +1,349 @@
+"""End-to-end benchmark for the publish pipeline.
+
+Feeds synthetic messages into `Publish.on_message` against a temporary SQLite database and a local aiohttp stub
+standing in for `publish_url`, then reports throughput, latency percentiles and event-loop lag.
+
+Run from the repository root:
+
+    python -m tests.bench_publish --messages 5000 --latency 20 --error-rate 0.01 --output bench.json
+    python -m tests.bench_publish --messages 5000 --compare bench.json
+
+Results are seeded and written as JSON so runs can be compared to catch regressions.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+from aiohttp import web
+
+SRC_PATH = Path(__file__).parent.parent / "src"
+BENCH_CHANNEL_OFFSET = 1_000_000
+
+
+def percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {"p50": None, "p99": None, "max": None}
+    if len(samples) == 1:
+        return {"p50": samples[0], "p99": samples[0], "max": samples[0]}
+    cuts = statistics.quantiles(samples, n=100, method="inclusive")
+    return {"p50": cuts[49], "p99": cuts[98], "max": max(samples)}
+
+
+class StubIngestionServer:
+    """Local stand-in for the publish endpoint that can inject latency and errors, records when items arrive."""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float, rng: random.Random):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rng = rng
+
+        self.received: dict[str, float] = {}
+        self.expected = 0  # `all_received` is set once this many distinct items arrived
+        self.all_received = asyncio.Event()
+        self.requests = 0
+        self.errors = 0
+        self.url = None
+        self._runner = None
+
+    async def start(self):
+        app = web.Application(client_max_size=64 * 1024**2)
+        app.router.add_post("/publish", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        self.url = f"http://127.0.0.1:{port}/publish"
+
+    async def close(self):
+        await self._runner.cleanup()
+
+    async def handle(self, request: web.Request) -> web.Response:
+        self.requests += 1
+        body = await request.json()
+        await asyncio.sleep(max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter)))
+
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            return web.Response(status=503, text="injected error")
+
+        now = time.perf_counter()
+        items = body if isinstance(body, list) else [body]
+        for item in items:
+            self.received.setdefault(item["content"], now)
+        if len(self.received) >= self.expected:
+            self.all_received.set()
+        if isinstance(body, list):
+            return web.json_response([{"ok": True} for _ in items])
+        return web.json_response({"ok": True})
+
+
+class LoopLagMonitor:
+    """Samples how late a periodic sleep wakes up, which is how long the event loop was blocked."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: list[float] = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - start - self.interval))
+
+
+def make_message(index: int, guild_id: int, user_id: int, content_size: int):
+    """Build a `discord.Message`-like object with the attributes the Publish cog reads."""
+    content = f"bench-{index} " + "x" * max(0, content_size)
+    return SimpleNamespace(
+        id=10**15 + index,
+        content=content,
+        guild=SimpleNamespace(id=guild_id),
+        channel=SimpleNamespace(id=BENCH_CHANNEL_OFFSET + guild_id),
+        author=SimpleNamespace(id=user_id, bot=False),
+        attachments=[],
+        embeds=[],
+    )
+
+
+async def seed_database(args):
+    """Seed routing and source keys before the cog loads them."""
+    from database import get_async_session
+    from ext.publish.data import set_guild_publishing_channel
+    from ext.publish.data import set_source_key
+
+    async with get_async_session() as session:
+        for guild_id in range(1, args.guilds + 1):
+            await set_guild_publishing_channel(session, guild_id, BENCH_CHANNEL_OFFSET + guild_id)
+            await set_source_key(session, guild_id, f"guild-{guild_id}")
+            for user_id in range(1, args.overrides + 1):
+                await set_source_key(session, guild_id, f"user-{guild_id}-{user_id}", user_id)
+
+
+async def feed_messages(cog, messages: list, rate: float) -> tuple[dict[str, float], list[float]]:
+    """Dispatch every message to `on_message`, returns when each was sent and how long each handler took."""
+    sent_at: dict[str, float] = {}
+    handler_times: list[float] = []
+
+    async def dispatch(message):
+        # discord.py runs every listener call in its own task, do the same
+        start = time.perf_counter()
+        sent_at[message.content] = start
+        await cog.on_message(message)
+        handler_times.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    tasks = []
+    for index, message in enumerate(messages):
+        tasks.append(asyncio.create_task(dispatch(message)))
+        if rate:
+            delay = start + (index + 1) / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        elif index % 100 == 0:
+            await asyncio.sleep(0)
+    await asyncio.gather(*tasks)
+    return sent_at, handler_times
+
+
+async def run(args) -> dict:
+    # imported late, settings are read from the environment prepared in `main`
+    import discord
+
+    import bot as bot_module
+    from configurable_cog import load_settings
+    from database import connect_to_db
+    from database import disconnect_from_db
+    from ext.publish.extension import Publish
+    from ext.publish.extension import default_settings
+    from ext.publish.worker import PublishWorker
+
+    if not args.log:
+        logging.getLogger("discord-aggregator").setLevel(logging.WARNING)
+
+    rng = random.Random(args.seed)  # noqa: S311
+    server = StubIngestionServer(args.latency / 1000, args.jitter / 1000, args.error_rate, rng)
+    server.expected = args.messages
+    await server.start()
+
+    await connect_to_db()
+
+    publish_settings = {
+        "publish_url": server.url,
+        "publish_api_key": "bench",
+        "queue_size": args.queue_size,
+        "queue_workers": args.workers,
+        "batch_enabled": args.batch,
+        "outbox_enabled": args.outbox,
+        "publish_mode": "gateway" if args.gateway else "inline",
+        "outbox_poll_interval": 0.05,
+        "outbox_backoff_base": 0.05,
+    }
+    publish_settings.update(json.loads(args.settings))
+    bot = bot_module.CustomBot(
+        command_prefix="=",
+        intents=discord.Intents.none(),
+        extension_settings={"publish": publish_settings},
+    )
+    cog = Publish(bot)
+
+    await seed_database(args)
+    await bot.add_cog(cog)
+    worker = None
+    if args.gateway:
+        # in-process stand-in for `publisher_worker.py`, it only shares the database with the cog
+        worker = PublishWorker(load_settings("publish", default_settings, bot.extension_settings))
+        await worker.start()
+
+    messages = [
+        make_message(
+            index,
+            guild_id=rng.randint(1, args.guilds),
+            user_id=rng.randint(1, args.users),
+            content_size=args.content_size,
+        )
+        for index in range(args.messages)
+    ]
+
+    monitor = LoopLagMonitor()
+    monitor.start()
+
+    start = time.perf_counter()
+    sent_at, handler_times = await feed_messages(cog, messages, args.rate)
+
+    # wait for everything to arrive, retried items may take a while with error injection
+    with contextlib.suppress(TimeoutError):
+        await asyncio.wait_for(server.all_received.wait(), args.timeout)
+    finished = time.perf_counter()
+
+    await bot.remove_cog(cog.qualified_name)
+    if worker:
+        await worker.close()
+    await disconnect_from_db()
+    await monitor.stop()
+    await server.close()
+
+    end_to_end = [server.received[key] - sent_at[key] for key in server.received if key in sent_at]
+    elapsed = (max(server.received.values()) if server.received else finished) - start
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "messages": len(messages),
+        "published": len(server.received),
+        "requests": server.requests,
+        "injected_errors": server.errors,
+        "elapsed_s": elapsed,
+        "throughput_msg_s": len(server.received) / elapsed if elapsed else 0.0,
+        "on_message_s": percentiles(handler_times),
+        "end_to_end_s": percentiles(end_to_end),
+        "loop_lag_s": percentiles(monitor.samples),
+    }
+
+
+def format_results(results: dict, baseline: dict | None = None) -> str:
+    def fmt(value, unit=""):
+        if value is None:
+            return "n/a"
+        if unit == "ms":
+            return f"{value * 1000:.2f}ms"
+        return f"{value:.1f}"
+
+    def delta(path, *, higher_is_better=False):
+        if not baseline:
+            return ""
+        current, previous = results, baseline
+        for key in path:
+            current, previous = current.get(key), (previous or {}).get(key)
+        if not current or not previous:
+            return ""
+        change = (current - previous) / previous * 100
+        worse = change < 0 if higher_is_better else change > 0
+        return f"  ({change:+.1f}%{' !' if worse and abs(change) > 10 else ''})"
+
+    lines = [
+        (
+            f"published        {results['published']}/{results['messages']} in {results['requests']} requests"
+            f" ({results['injected_errors']} injected errors)"
+        ),
+        (
+            f"throughput       {fmt(results['throughput_msg_s'])} msg/s"
+            f"{delta(['throughput_msg_s'], higher_is_better=True)}"
+        ),
+    ]
+    for name, key in (("on_message", "on_message_s"), ("end-to-end", "end_to_end_s"), ("loop lag", "loop_lag_s")):
+        stats = results[key]
+        lines.append(
+            f"{name:<16} p50 {fmt(stats['p50'], 'ms')}{delta([key, 'p50'])}"
+            f"  p99 {fmt(stats['p99'], 'ms')}{delta([key, 'p99'])}"
+            f"  max {fmt(stats['max'], 'ms')}",
+        )
+    return "\n".join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000, help="number of synthetic messages")
+    parser.add_argument("--rate", type=float, default=0, help="messages per second to feed, 0 is as fast as possible")
+    parser.add_argument("--guilds", type=int, default=10, help="guilds with a publishing channel")
+    parser.add_argument("--users", type=int, default=200, help="distinct authors per guild")
+    parser.add_argument("--overrides", type=int, default=20, help="users per guild with a source key override")
+    parser.add_argument("--content-size", type=int, default=200, help="bytes of filler per message")
+    parser.add_argument("--latency", type=float, default=10, help="stub endpoint latency in milliseconds")
+    parser.add_argument("--jitter", type=float, default=2, help="stub endpoint latency jitter in milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 503")
+    parser.add_argument("--workers", type=int, default=4, help="publish queue workers")
+    parser.add_argument("--queue-size", type=int, default=1000, help="publish queue size")
+    parser.add_argument("--batch", action="store_true", help="enable batched publishing")
+    parser.add_argument("--outbox", action="store_true", help="publish through the SQLite outbox")
+    parser.add_argument("--gateway", action="store_true", help="store jobs in gateway mode and run a publisher worker")
+    parser.add_argument("--settings", default="{}", help="extra publish settings as a JSON object")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds to wait for every message to arrive")
+    parser.add_argument("--seed", type=int, default=0, help="random seed, keep it fixed to compare runs")
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    parser.add_argument("--compare", type=Path, help="baseline JSON results to compare against")
+    parser.add_argument("--log", action="store_true", help="keep the publisher's per-message logging")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # the bot reads its configuration from the environment on import
+    tmpdir = tempfile.TemporaryDirectory()
+    os.environ["DEV"] = "false"
+    os.environ["DATABASE_PATH"] = "/" + str(Path(tmpdir.name) / "bench.db")
+    sys.path.insert(0, str(SRC_PATH))
+
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        tmpdir.cleanup()
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else None
+    sys.stdout.write(format_results(results, baseline) + "\n")
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
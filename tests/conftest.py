@@ -0,0 +1,27 @@
+import asyncio
+import os
+
+import pytest
+
+# settings are read from the environment on import
+os.environ["DEV"] = "false"
+
+import database.setup
+
+
+@pytest.fixture
+def run_with_db(tmp_path, monkeypatch):
+    """Run a coroutine function against a fresh SQLite database, with every registered table created."""
+    monkeypatch.setattr(database.setup, "DATABASE_URL", f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+
+    def run(test):
+        async def main():
+            await database.setup.connect_to_db()
+            try:
+                return await test()
+            finally:
+                await database.setup.disconnect_from_db()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+from database import get_async_session
+from ext.publish.backfill import Backfill
+from ext.publish.data import get_backfill_checkpoint
+from ext.publish.pipeline import PublishJob
+
+
+class FakeChannel:
+    id = 10
+    mention = "#history"
+    guild = SimpleNamespace(id=1)
+
+    def __init__(self, message_ids: list[int]):
+        self.messages = [SimpleNamespace(id=message_id, author=SimpleNamespace(id=5)) for message_id in message_ids]
+
+    async def history(self, *, limit, after, oldest_first):
+        for message in self.messages:
+            if after is None or message.id > after.id:
+                yield message
+
+
+def make_job(message, source_key) -> PublishJob:
+    return PublishJob(str(message.id), source_key, guild_id=1, message_id=message.id)
+
+
+def make_backfill(channel: FakeChannel, failures: dict[int, int], **kwargs) -> tuple[Backfill, list[int]]:
+    """`failures` is how many times publishing each message ID fails before it succeeds."""
+    submitted = []
+
+    async def submit(jobs):
+        results = []
+        for job in jobs:
+            submitted.append(job.message_id)
+            results.append(failures.get(job.message_id, 0) <= 0)
+            failures[job.message_id] = failures.get(job.message_id, 0) - 1
+        return results
+
+    kwargs = {"make_job": make_job, "rate": 0, "page_size": 2, "retry_delay": 0, **kwargs}
+    return Backfill(channel, submit, **kwargs), submitted
+
+
+async def checkpoint():
+    async with get_async_session() as session:
+        return await get_backfill_checkpoint(session, FakeChannel.id)
+
+
+def test_backfill_publishes_every_page(run_with_db):
+    async def test():
+        backfill, submitted = make_backfill(FakeChannel([1, 2, 3, 4, 5]), {})
+        await backfill.run()
+        assert submitted == [1, 2, 3, 4, 5]
+
+        saved = await checkpoint()
+        assert (saved.status, saved.last_message_id, saved.published) == ("done", 5, 5)
+
+    run_with_db(test)
+
+
+def test_backfill_retries_failures(run_with_db):
+    async def test():
+        backfill, submitted = make_backfill(FakeChannel([1, 2, 3, 4]), {3: 1}, retries=2)
+        await backfill.run()
+        assert submitted.count(3) == 2
+        assert (backfill.status, backfill.published, backfill.failed) == ("done", 4, 0)
+
+    run_with_db(test)
+
+
+def test_backfill_stops_before_a_message_that_keeps_failing(run_with_db):
+    async def test():
+        channel = FakeChannel([1, 2, 3, 4, 5, 6])
+        backfill, submitted = make_backfill(channel, {4: 100}, retries=1)
+        await backfill.run()
+        assert submitted == [1, 2, 3, 4, 4]  # 5 and 6 are never reached
+
+        saved = await checkpoint()
+        assert (saved.status, saved.last_message_id, saved.failed) == ("failed", 3, 1)
+
+        # once the endpoint recovers, starting again resumes with the failed message
+        resumed, submitted = make_backfill(channel, {})
+        await resumed.run()
+        assert submitted == [4, 5, 6]
+        assert (await checkpoint()).status == "done"
+
+    run_with_db(test)
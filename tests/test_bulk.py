@@ -0,0 +1,83 @@
+import pytest
+
+from ext.publish.bulk import BulkImportError
+from ext.publish.bulk import BulkRecord
+from ext.publish.bulk import changed_records
+from ext.publish.bulk import diff_lines
+from ext.publish.bulk import format_header
+from ext.publish.bulk import format_record
+from ext.publish.bulk import parse_records
+
+RECORDS = [
+    BulkRecord("channel", 1, channel_id=10),
+    BulkRecord("guild_key", 1, source_key="guild"),
+    BulkRecord("user_key", 1, user_id=5, source_key="user"),
+]
+
+
+def errors(data: bytes, file_format: str) -> list[str]:
+    with pytest.raises(BulkImportError) as e:
+        parse_records(data, file_format)
+    return e.value.errors
+
+
+@pytest.mark.parametrize("file_format", ["csv", "jsonl"])
+def test_exported_records_parse_back(file_format):
+    data = format_header(file_format) + "".join(format_record(record, file_format) for record in RECORDS)
+    assert parse_records(data.encode(), file_format) == RECORDS
+
+
+def test_csv_errors_are_listed_by_line():
+    data = (
+        "type,guild_id,user_id,channel_id,source_key\n"
+        "channel,1,,10,\n"
+        "channel,1.5,,10,\n"
+        "guild_key,2,,,\n"
+        "unknown,2,,,\n"
+        "user_key,2,-3,,key\n"
+        "channel,1,,11,\n"
+    )
+    assert errors(data.encode(), "csv") == [
+        "line 3: guild_id '1.5' is not an ID",
+        "line 4: missing source_key",
+        "line 5: unknown type 'unknown', was expecting one of channel, guild_key, user_key",
+        "line 6: user_id '-3' is not an ID",
+        "line 7: channel guild 1 is already set on line 2",
+    ]
+
+
+def test_csv_header_must_name_type_and_guild():
+    assert errors(b"channel_id\n10\n", "csv") == ["line 1: the header is missing guild_id, type"]
+
+
+def test_jsonl_errors_are_listed_by_line():
+    data = (
+        b'{"type": "channel", "guild_id": 1, "channel_id": 10}\n'
+        b"\n"
+        b"not json\n"
+        b'["channel", 1, 10]\n'
+        b'{"type": "channel", "guild_id": true, "channel_id": 10}\n'
+    )
+    assert errors(data, "jsonl") == [
+        "line 3: not a JSON object",
+        "line 4: not a JSON object",
+        "line 5: guild_id True is not an ID",
+    ]
+
+
+def test_file_must_be_utf8():
+    assert errors("type,guild_id\nguild_key,1,é".encode("latin-1"), "csv") == ["the file is not UTF-8"]
+    # a byte order mark is fine
+    assert parse_records("\ufefftype,guild_id,source_key\nguild_key,1,a\n".encode(), "csv") == [
+        BulkRecord("guild_key", 1, source_key="a"),
+    ]
+
+
+def test_changed_records_and_diff():
+    current = {("channel", 1, None): 10, ("guild_key", 1, None): "old"}
+    changed = changed_records(RECORDS, current)
+    assert changed == RECORDS[1:]
+    assert diff_lines(changed, current) == [
+        "~ guild_key guild 1: old -> guild",
+        "+ user_key guild 1 user 5: user",
+    ]
@@ -0,0 +1,90 @@
+from ext.publish.cache import MISSING
+from ext.publish.cache import LRUCache
+from ext.publish.cache import RecentIds
+
+
+def test_lru_get_and_miss():
+    cache = LRUCache()
+    assert cache.get("key") is MISSING
+    cache.set("key", "value")
+    cache.set("none", None)
+    assert cache.get("key") == "value"
+    assert cache.get("none") is None  # cached negative result
+
+
+def test_lru_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_lru_entries_expire():
+    cache = LRUCache(ttl=-1)
+    cache.set("key", "value")
+    assert cache.get("key") is MISSING
+    assert len(cache) == 0
+
+
+def test_lru_configure_shrinks():
+    cache = LRUCache(maxsize=10)
+    for key in range(10):
+        cache.set(key, key)
+    cache.configure(maxsize=3, ttl=300)
+    assert len(cache) == 3
+    assert cache.get(9) == 9
+    assert cache.get(0) is MISSING
+
+
+def test_lru_invalidation():
+    cache = LRUCache()
+    for key in [(1, None), (1, 5), (2, None)]:
+        cache.set(key, "value")
+    cache.invalidate((2, None))
+    assert cache.get((2, None)) is MISSING
+    cache.invalidate_where(lambda key: key[0] == 1)
+    assert len(cache) == 0
+
+
+def test_recent_ids_window():
+    recent = RecentIds(3)
+    assert recent.add(1)
+    assert not recent.add(1)
+    for item in (2, 3, 4):
+        recent.add(item)
+    assert 1 not in recent
+    assert len(recent) == 3
+    assert recent.add(1)
+
+
+def test_recent_ids_discard():
+    recent = RecentIds(3)
+    recent.add(1)
+    recent.discard(1)
+    assert 1 not in recent
+    assert recent.add(1)
+
+
+def test_recent_ids_stale_slot_does_not_evict_readded_id():
+    recent = RecentIds(2)
+    recent.add(1)
+    recent.discard(1)
+    recent.add(1)
+    recent.add(2)  # evicts the slot of the discarded 1
+    assert 1 in recent
+    assert 2 in recent
+    recent.add(3)  # evicts the slot of the re-added 1
+    assert 1 not in recent
+    assert len(recent) == 2
+
+
+def test_recent_ids_zero_window_disables_dedup():
+    recent = RecentIds(0)
+    assert recent.add(1)
+    assert recent.add(1)
+    assert 1 not in recent
+    assert len(recent) == 0
@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+
+from discord import app_commands
+
+import ext.publish.extension
+from configurable_cog import load_settings
+from ext.publish.data import get_all_publishing_channels
+from ext.publish.extension import Publish
+from ext.publish.extension import default_settings
+
+
+class FakeResponse:
+    async def send_message(self, *args, **kwargs):
+        pass
+
+
+def test_refresh_does_not_revert_a_concurrent_command(run_with_db, monkeypatch):
+    reads = 0
+
+    async def slow_channels(session):
+        nonlocal reads
+        reads += 1
+        if reads > 1:
+            await asyncio.Event().wait()  # only the first refresh gets to apply its snapshot
+        # the refresh has read the channels before the command's write commits
+        channels = await get_all_publishing_channels(session)
+        await asyncio.sleep(0.05)
+        return channels
+
+    monkeypatch.setattr(ext.publish.extension, "get_all_publishing_channels", slow_channels)
+
+    async def test():
+        cog = Publish(SimpleNamespace())
+        cog.settings = load_settings("publish", default_settings, {"publish": {"routing_refresh_interval": 0.0}})
+        refresh = asyncio.create_task(cog._refresh_routing())  # noqa: SLF001
+        await asyncio.sleep(0.01)
+
+        interaction = SimpleNamespace(guild_id=1, response=FakeResponse())
+        channel = SimpleNamespace(id=10, mention="#publish")
+        choice = app_commands.Choice(name="Set Channel", value="set")
+        await cog.manage_auto_publishing.callback(cog, interaction, choice, channel)
+        assert cog.publishing_channels == {1: 10}
+
+        await asyncio.sleep(0.1)  # let the refresh that was in progress apply its snapshot
+        assert reads > 1
+        refresh.cancel()
+        await asyncio.gather(refresh, return_exceptions=True)
+        assert cog.publishing_channels == {1: 10}
+
+    run_with_db(test)
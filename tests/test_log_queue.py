@@ -0,0 +1,45 @@
+import logging
+import time
+
+import pytest
+
+import log_queue
+import settings  # noqa: F401, sets up the app loggers
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.records: list[logging.LogRecord] = []
+
+    def emit(self, record: logging.LogRecord):
+        self.records.append(record)
+
+
+@pytest.fixture
+def listened(monkeypatch) -> list[logging.LogRecord]:
+    """Records written by the listener thread."""
+    handler = ListHandler()
+    listener = log_queue._listener  # noqa: SLF001
+    monkeypatch.setattr(listener, "handlers", (*listener.handlers, handler))
+    return handler.records
+
+
+def wait_for(records: list[logging.LogRecord], count: int):
+    deadline = time.monotonic() + 2
+    while len(records) < count and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def test_cog_logger_records_reach_the_listener(listened, monkeypatch):
+    last_resort = ListHandler()
+    monkeypatch.setattr(logging, "lastResort", last_resort)
+    logger = logging.getLogger("bloom.test")
+    logger.setLevel(logging.INFO)
+
+    logger.info("Loaded %d publishing channels", 3)
+    wait_for(listened, 1)
+
+    assert [record.getMessage() for record in listened] == ["Loaded 3 publishing channels"]
+    assert last_resort.records == []
+
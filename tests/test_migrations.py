@@ -0,0 +1,78 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy import inspect
+
+from database.migrations import MIGRATIONS
+from database.migrations import run_migrations
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    yield engine
+    engine.dispose()
+
+
+def user_version(conn) -> int:
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def test_migrations_tolerate_missing_tables(engine):
+    with engine.begin() as conn:
+        run_migrations(conn)
+        assert user_version(conn) == len(MIGRATIONS)
+
+
+def test_override_duplicates_are_removed_before_the_unique_index(engine):
+    with engine.begin() as conn:
+        # the schema before the unique index existed
+        conn.exec_driver_sql(
+            "CREATE TABLE guild_user_source_key_override "
+            "(id INTEGER PRIMARY KEY AUTOINCREMENT, guild_id BIGINT, user_id BIGINT, source_key VARCHAR NOT NULL)",
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO guild_user_source_key_override (guild_id, user_id, source_key) "
+            "VALUES (1, 5, 'old'), (1, 5, 'new'), (1, 6, 'other'), (2, 5, 'guild-2')",
+        )
+        run_migrations(conn)
+
+        rows = conn.exec_driver_sql(
+            "SELECT guild_id, user_id, source_key FROM guild_user_source_key_override ORDER BY id",
+        ).all()
+        assert rows == [(1, 5, "new"), (1, 6, "other"), (2, 5, "guild-2")]
+        indexes = inspect(conn).get_indexes("guild_user_source_key_override")
+        assert any(index["unique"] and index["column_names"] == ["guild_id", "user_id"] for index in indexes)
+
+
+def test_migrations_run_once(engine, monkeypatch):
+    applied = []
+    monkeypatch.setattr("database.migrations.MIGRATIONS", [applied.append, applied.append])
+
+    with engine.begin() as conn:
+        run_migrations(conn)
+        run_migrations(conn)
+        assert user_version(conn) == 2
+    assert len(applied) == 2
+
+
+def test_outbox_gets_guild_turns(engine):
+    with engine.begin() as conn:
+        # the schema before entries were claimed by guild
+        conn.exec_driver_sql(
+            "CREATE TABLE publish_outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, payload VARCHAR NOT NULL, "
+            "status VARCHAR NOT NULL, attempts INTEGER NOT NULL, next_attempt_at FLOAT NOT NULL, "
+            "claimed_until FLOAT, created_at FLOAT NOT NULL)",
+        )
+        conn.exec_driver_sql(
+            "CREATE INDEX ix_publish_outbox_status_next_attempt_at ON publish_outbox (status, next_attempt_at)",
+        )
+        conn.exec_driver_sql(
+            "INSERT INTO publish_outbox (payload, status, attempts, next_attempt_at, created_at) "
+            "VALUES ('{}', 'pending', 0, 0, 0)",
+        )
+        run_migrations(conn)
+
+        assert {"guild_id", "turn"} <= {column["name"] for column in inspect(conn).get_columns("publish_outbox")}
+        assert conn.exec_driver_sql("SELECT id, guild_id, turn FROM publish_outbox").all() == [(1, None, None)]
+        indexes = {index["name"] for index in inspect(conn).get_indexes("publish_outbox")}
+        assert indexes == {"ix_publish_outbox_status_turn", "ix_publish_outbox_guild_turn"}
@@ -0,0 +1,135 @@
+import time
+
+from sqlalchemy import select
+
+from database import get_async_session
+from ext.publish.data import PublishOutbox
+from ext.publish.data import add_outbox_entries
+from ext.publish.data import claim_outbox_entries
+from ext.publish.data import set_guild_schedule
+from ext.publish.data import settle_outbox_entries
+from ext.publish.outbox import OutboxDispatcher
+from ext.publish.pipeline import PublishJob
+
+
+def job(index: int, guild_id: int = 1) -> tuple[str, int]:
+    return PublishJob(f"message {index}", guild_id=guild_id, message_id=index).dumps(), guild_id
+
+
+async def outbox_rows() -> dict[int, PublishOutbox]:
+    async with get_async_session() as session:
+        result = await session.execute(select(PublishOutbox))
+        return {row.id: row for row in result.scalars()}
+
+
+def test_claim_leases_entries(run_with_db):
+    async def test():
+        async with get_async_session() as session:
+            await add_outbox_entries(session, [job(index) for index in range(5)])
+            first = await claim_outbox_entries(session, 3, lease=60)
+            second = await claim_outbox_entries(session, 10, lease=60)
+            third = await claim_outbox_entries(session, 10, lease=60)
+
+        assert [entry_id for entry_id, _, _ in first] == [1, 2, 3]
+        assert [entry_id for entry_id, _, _ in second] == [4, 5]
+        assert third == []
+        assert PublishJob.loads(first[0][1]).content == "message 0"
+        assert all(row.status == "in_flight" for row in (await outbox_rows()).values())
+
+    run_with_db(test)
+
+
+def test_claim_takes_turns_between_guilds(run_with_db):
+    def claimed_ids(claimed) -> list[int]:
+        return [entry_id for entry_id, _, _ in claimed]
+
+    async def test():
+        async with get_async_session() as session:
+            await set_guild_schedule(session, 2, weight=2)
+            # guild 1 stores a backlog before guild 2 and 3 have anything to publish
+            await add_outbox_entries(session, [job(index, guild_id=1) for index in range(1, 11)])
+            await add_outbox_entries(session, [job(index, guild_id=2) for index in range(11, 15)])
+            await add_outbox_entries(session, [job(15, guild_id=3)])
+
+            # one turn per guild by weight, the oldest entries of each guild first
+            assert claimed_ids(await claim_outbox_entries(session, 4, lease=60)) == [1, 2, 11, 12]
+            assert claimed_ids(await claim_outbox_entries(session, 4, lease=60)) == [3, 13, 14, 15]
+            assert claimed_ids(await claim_outbox_entries(session, 4, lease=60)) == [4, 5, 6, 7]
+
+            # a guild storing entries later starts at the oldest pending turn, not behind the backlog
+            await add_outbox_entries(session, [job(16, guild_id=3)])
+            assert claimed_ids(await claim_outbox_entries(session, 4, lease=60)) == [8, 9, 10, 16]
+
+    run_with_db(test)
+
+
+def test_claim_retakes_expired_leases(run_with_db):
+    async def test():
+        async with get_async_session() as session:
+            await add_outbox_entries(session, [job(0)])
+            await claim_outbox_entries(session, 10, lease=-1)
+            reclaimed = await claim_outbox_entries(session, 10, lease=60)
+        assert [entry_id for entry_id, _, _ in reclaimed] == [1]
+
+    run_with_db(test)
+
+
+def test_settle_deletes_and_reschedules(run_with_db):
+    async def test():
+        later = time.time() + 3600
+        async with get_async_session() as session:
+            await add_outbox_entries(session, [job(index) for index in range(3)])
+            await claim_outbox_entries(session, 10, lease=60)
+            await settle_outbox_entries(
+                session,
+                [1],
+                [
+                    {"id": 2, "status": "pending", "attempts": 1, "next_attempt_at": later},
+                    {"id": 3, "status": "dead", "attempts": 8, "next_attempt_at": later},
+                ],
+            )
+            # neither the rescheduled entry nor the dead one is due
+            assert await claim_outbox_entries(session, 10, lease=60) == []
+
+        rows = await outbox_rows()
+        assert set(rows) == {2, 3}
+        assert (rows[2].status, rows[2].attempts, rows[2].claimed_until) == ("pending", 1, None)
+        assert rows[3].status == "dead"
+
+    run_with_db(test)
+
+
+def test_dispatch_dead_letters_undecodable_entries(run_with_db):
+    sent = []
+
+    async def send(jobs):
+        sent.extend(jobs)
+        return [True] * len(jobs)
+
+    async def test():
+        async with get_async_session() as session:
+            await add_outbox_entries(session, [job(0), ("not json", 1), ('["not", "a", "job"]', 1), job(1)])
+        assert await OutboxDispatcher(send).dispatch_once() == 4
+
+        rows = await outbox_rows()
+        assert {row.id: row.status for row in rows.values()} == {2: "dead", 3: "dead"}
+
+    run_with_db(test)
+    assert [job.message_id for job in sent] == [0, 1]
+
+
+def test_dispatch_counts_send_errors_as_attempts(run_with_db):
+    async def send(jobs):
+        raise RuntimeError
+
+    async def test():
+        async with get_async_session() as session:
+            await add_outbox_entries(session, [job(0)])
+        dispatcher = OutboxDispatcher(send, max_attempts=2, backoff_base=0, backoff_max=0)
+
+        await dispatcher.dispatch_once()
+        assert (await outbox_rows())[1].status == "pending"
+        await dispatcher.dispatch_once()
+        assert (await outbox_rows())[1].status == "dead"
+
+    run_with_db(test)
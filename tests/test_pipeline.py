@@ -0,0 +1,68 @@
+import asyncio
+
+from ext.publish.pipeline import PublishJob
+from ext.publish.pipeline import PublishQueue
+
+
+def job(message_id: int, guild_id: int = 1) -> PublishJob:
+    return PublishJob(f"message {message_id}", guild_id=guild_id, message_id=message_id)
+
+
+def message_ids(jobs: list[PublishJob]) -> list[int]:
+    return sorted(job.message_id for job in jobs)
+
+
+def test_overflow_drops_are_reported():
+    dropped = []
+
+    async def handler(jobs):
+        pass
+
+    async def test():
+        queue = PublishQueue(handler, on_drop=dropped.extend, maxsize=2, overflow="drop_oldest")
+        # not started, so nothing is taken off the queue
+        for message_id in range(3):
+            assert await queue.put(job(message_id))
+
+    asyncio.run(test())
+    assert message_ids(dropped) == [0]
+
+
+def test_failed_batches_are_reported():
+    dropped = []
+
+    async def handler(jobs):
+        if jobs[0].message_id == 1:
+            raise RuntimeError
+
+    async def test():
+        queue = PublishQueue(handler, on_drop=dropped.extend)
+        await queue.start()
+        for message_id in range(3):
+            await queue.put(job(message_id))
+        await queue.close(1)
+
+    asyncio.run(test())
+    assert message_ids(dropped) == [1]
+
+
+def test_close_timeout_reports_abandoned_jobs():
+    dropped = []
+    handled = []
+
+    async def handler(jobs):
+        handled.extend(jobs)
+        await asyncio.sleep(10)
+
+    async def test():
+        queue = PublishQueue(handler, on_drop=dropped.extend, workers=1)
+        await queue.start()
+        for message_id in range(3):
+            await queue.put(job(message_id))
+        await asyncio.sleep(0.01)
+        await queue.close(0.05)
+
+    asyncio.run(test())
+    # the job being handled is abandoned too, not only the queued ones
+    assert message_ids(handled) == [0]
+    assert message_ids(dropped) == [0, 1, 2]
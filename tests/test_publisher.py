@@ -0,0 +1,104 @@
+import asyncio
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from ext.publish.publisher import Destination
+from ext.publish.publisher import Publisher
+from ext.publish.ratelimit import CircuitBreaker
+
+
+async def start_server(publish_delay: float = 0.0) -> TestServer:
+    async def publish(request):
+        await request.read()
+        await asyncio.sleep(publish_delay)
+        return web.Response(text="ok")
+
+    async def missing(request):
+        return web.Response(status=404)
+
+    app = web.Application()
+    app.router.add_post("/publish", publish)
+    app.router.add_get("/missing", missing)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+async def half_open_publisher(server: TestServer) -> Publisher:
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05, half_open_max=1)
+    publisher = Publisher(str(server.make_url("/publish")), None, breaker=breaker)
+    await publisher.start()
+    breaker.record_failure()
+    await asyncio.sleep(0.06)
+    return publisher
+
+
+def test_attachment_failure_releases_probe():
+    attachment = {"id": 1, "url": None, "filename": "a.txt", "content_type": "text/plain", "size": 1}
+
+    async def test():
+        server = await start_server()
+        publisher = await half_open_publisher(server)
+        try:
+            missing = {**attachment, "url": str(server.make_url("/missing"))}
+            assert not await publisher.publish({"content": "a"}, attachments=[missing])
+            assert publisher.breaker.state == CircuitBreaker.HALF_OPEN
+
+            # the probe slot is free again, the next publish closes the breaker
+            assert await publisher.publish({"content": "b"})
+            assert publisher.breaker.state == CircuitBreaker.CLOSED
+        finally:
+            await publisher.close()
+            await server.close()
+
+    asyncio.run(test())
+
+
+def test_cancelled_publish_releases_probe():
+    async def test():
+        server = await start_server(publish_delay=10)
+        publisher = await half_open_publisher(server)
+        try:
+            task = asyncio.create_task(publisher.publish({"content": "a"}))
+            await asyncio.sleep(0.1)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            assert publisher.breaker.allow()
+        finally:
+            await publisher.close()
+            await server.close()
+
+    asyncio.run(test())
+
+
+def test_compression_fallback_is_per_endpoint():
+    encodings = []
+
+    async def publish(request):
+        await request.read()
+        encoding = request.headers.get("Content-Encoding")
+        encodings.append((request.path, encoding))
+        if request.path == "/plain" and encoding:
+            return web.Response(status=415)
+        return web.Response(text="ok")
+
+    async def test():
+        app = web.Application()
+        app.router.add_post("/gzip", publish)
+        app.router.add_post("/plain", publish)
+        server = TestServer(app)
+        await server.start_server()
+        publisher = Publisher(str(server.make_url("/gzip")), None, compression="gzip", compression_threshold=0)
+        await publisher.start()
+        plain = Destination("plain", str(server.make_url("/plain")))
+        try:
+            assert await publisher.publish({"content": "a"}, plain)
+            assert await publisher.publish({"content": "b"}, plain)
+            assert await publisher.publish({"content": "c"})
+        finally:
+            await publisher.close()
+            await server.close()
+
+    asyncio.run(test())
+    assert encodings == [("/plain", "gzip"), ("/plain", None), ("/plain", None), ("/gzip", "gzip")]
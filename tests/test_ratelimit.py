@@ -0,0 +1,114 @@
+import asyncio
+import time
+from datetime import UTC
+from datetime import datetime
+from datetime import timedelta
+from email.utils import format_datetime
+
+from ext.publish.ratelimit import CircuitBreaker
+from ext.publish.ratelimit import TokenBucket
+from ext.publish.ratelimit import parse_retry_after
+
+
+def timed_acquires(bucket: TokenBucket, count: int) -> float:
+    """Seconds `count` concurrent callers take to acquire a token each."""
+
+    async def main():
+        start = time.monotonic()
+        await asyncio.gather(*(bucket.acquire() for _ in range(count)))
+        return time.monotonic() - start
+
+    return asyncio.run(main())
+
+
+def test_parse_retry_after():
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("garbage") is None
+    assert parse_retry_after("12") == 12.0
+    assert parse_retry_after("-5") == 0.0
+    http_date = format_datetime(datetime.now(UTC) + timedelta(seconds=60), usegmt=True)
+    assert 55 < parse_retry_after(http_date) <= 60
+
+
+def test_disabled_bucket_does_not_wait():
+    bucket = TokenBucket(0, 1)
+    assert not bucket.enabled
+    assert timed_acquires(bucket, 100) < 0.05
+
+
+def test_pause_applies_when_disabled():
+    bucket = TokenBucket(0, 1)
+    bucket.pause(0.2)
+    assert timed_acquires(bucket, 1) >= 0.15
+
+
+def test_bucket_limits_rate_after_burst():
+    bucket = TokenBucket(20, 2)
+    # the burst is free, the next 2 tokens take 1/20s each
+    assert timed_acquires(bucket, 4) >= 0.08
+
+
+def test_penalize_and_reward_stay_in_bounds():
+    bucket = TokenBucket(10, 1, min_rate=2)
+    for _ in range(5):
+        bucket.penalize()
+    assert bucket.rate == 2
+    for _ in range(100):
+        bucket.reward()
+    assert bucket.rate == 10
+
+
+def test_breaker_opens_after_threshold():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.record_failure()
+        assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert not breaker.allow()
+    assert breaker.total_opens == 1
+
+
+def test_breaker_success_resets_failures():
+    breaker = CircuitBreaker(failure_threshold=2)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_half_open_probes():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05, half_open_max=1)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()  # only one probe at a time
+
+    # a failed probe re-opens it, a successful one closes it
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.total_opens == 1
+
+
+def test_breaker_honors_longer_retry_after():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=1)
+    breaker.record_failure(retry_after=30)
+    assert breaker.retry_in() > 29
+
+
+def test_breaker_release_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05, half_open_max=1)
+    breaker.record_failure()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.release_probe()
+    assert breaker.allow()  # the slot was given back
+    breaker.release_probe()
+    breaker.release_probe()
+    assert breaker.allow()
+    assert not breaker.allow()  # never released below zero
@@ -0,0 +1,125 @@
+import asyncio
+import operator
+
+import pytest
+
+from ext.publish.scheduler import FairQueue
+
+
+def fair_queue(**kwargs) -> FairQueue:
+    return FairQueue(key=operator.itemgetter(0), **kwargs)
+
+
+def drain(queue: FairQueue) -> list[tuple[int, int]]:
+    jobs = []
+    while True:
+        try:
+            jobs.append(queue.get_nowait())
+        except asyncio.QueueEmpty:
+            return jobs
+
+
+def test_guilds_take_turns_by_weight():
+    queue = fair_queue(weights={1: 2})
+    for index in range(4):
+        queue.put_nowait((1, index))
+    for index in range(2):
+        queue.put_nowait((2, index))
+
+    assert drain(queue) == [(1, 0), (1, 1), (2, 0), (1, 2), (1, 3), (2, 1)]
+    assert queue.qsize() == 0
+
+
+def test_weights_apply_immediately():
+    weights = {}
+    queue = fair_queue(weights=weights)
+    for guild_id in (1, 2):
+        for index in range(3):
+            queue.put_nowait((guild_id, index))
+
+    assert queue.get_nowait() == (1, 0)
+    weights[2] = 2
+    assert drain(queue) == [(2, 0), (2, 1), (1, 1), (2, 2), (1, 2)]
+
+
+def test_max_in_flight_skips_capped_guild():
+    queue = fair_queue(max_in_flight={1: 1})
+    queue.put_nowait((1, 0))
+    queue.put_nowait((1, 1))
+    queue.put_nowait((2, 0))
+
+    first = queue.get_nowait()
+    assert first == (1, 0)
+    assert queue.get_nowait() == (2, 0)
+    with pytest.raises(asyncio.QueueEmpty):
+        queue.get_nowait()
+
+    queue.task_done(first)
+    assert queue.get_nowait() == (1, 1)
+
+
+def test_maxsize_and_drop_oldest():
+    queue = fair_queue(maxsize=3)
+    queue.put_nowait((1, 0))
+    queue.put_nowait((2, 0))
+    queue.put_nowait((2, 1))
+    assert queue.full()
+    with pytest.raises(asyncio.QueueFull):
+        queue.put_nowait((3, 0))
+
+    # the guild with the most queued jobs loses its oldest one
+    assert queue.drop_oldest() == (2, 0)
+    assert not queue.full()
+    assert queue.guild_sizes() == {1: 1, 2: 1}
+    assert fair_queue().drop_oldest() is None
+
+
+def test_join_waits_for_task_done():
+    async def test():
+        queue = fair_queue()
+        queue.put_nowait((1, 0))
+        joined = asyncio.create_task(queue.join())
+
+        job = await queue.get()
+        await asyncio.sleep(0)
+        assert not joined.done()
+
+        queue.task_done(job)
+        await asyncio.wait_for(joined, 1)
+
+    asyncio.run(test())
+
+
+def test_put_waits_for_room():
+    async def test():
+        queue = fair_queue(maxsize=1)
+        queue.put_nowait((1, 0))
+        put = asyncio.create_task(queue.put((1, 1)))
+        await asyncio.sleep(0)
+        assert not put.done()
+
+        assert await queue.get() == (1, 0)
+        await asyncio.wait_for(put, 1)
+        assert queue.qsize() == 1
+
+    asyncio.run(test())
+
+
+def test_clear_returns_queued_jobs():
+    async def test():
+        queue = fair_queue()
+        for job in ((1, 0), (1, 1), (2, 0)):
+            queue.put_nowait(job)
+        taken = queue.get_nowait()
+        joined = asyncio.create_task(queue.join())
+
+        assert sorted(queue.clear()) == [(1, 1), (2, 0)]
+        assert queue.qsize() == 0
+        assert queue.guild_sizes() == {}
+        await asyncio.sleep(0)
+        assert not joined.done()  # the job taken by `get` is still unfinished
+
+        queue.task_done(taken)
+        await asyncio.wait_for(joined, 1)
+
+    asyncio.run(test())